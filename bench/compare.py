@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+"""
+The compare module prints the ratios of two results of run.py, e.g. a
+commit against its parent:
+
+    python bench/compare.py old.json new.json
+"""
+
+import sys
+import json
+
+def load(path):
+    with open(path) as fobj:
+        return json.load(fobj)
+
+def main():
+    if len(sys.argv) != 3:
+        print("usage: compare.py OLD NEW")
+        exit()
+
+    old, new = load(sys.argv[1]), load(sys.argv[2])
+    print('old:', old['commit'], ' new:', new['commit'])
+
+    old_results = dict((r['tags_target'], r) for r in old['results'])
+    for res in new['results']:
+        base = old_results.get(res['tags_target'])
+        if not base:
+            continue
+
+        print('tags %d:' % res['tags_target'])
+        for key in sorted(res):
+            if not key.startswith(('add', 'update', 'remove', 'find',
+                                   'completion')):
+                continue
+
+            if key in base and base[key]:
+                print('    %-20s %12.6fs %12.6fs  x%.2f' %
+                      (key, base[key], res[key], res[key] / base[key]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+The corpus module generates a synthetic C source tree for benchmarks.
+
+the tree is decided by its parameters and seed only, so the same
+benchmark runs on the same tree everywhere.  headers are arranged in
+levels: the source files include headers of level 0, and a header of
+level l includes headers of level l + 1.
+"""
+
+import os
+import random
+
+class CorpusConfig:
+
+    def __init__(self, headers = 100, files = 25, fanout = 4, depth = 4,
+                 structs = 5, members = 8, macros = 2, seed = 0):
+        self.headers = headers
+        self.files = files
+
+        # number of headers included by each file, and levels of headers.
+        self.fanout = fanout
+        self.depth = depth
+
+        # structs per header, members per struct, macros per struct.
+        self.structs = structs
+        self.members = members
+        self.macros = macros
+
+        self.seed = seed
+
+    def tags_per_header(self):
+        # ctags reports every member twice, as "m" and "s::m", and a
+        # typedef, a prototype and macros for every struct.
+        return self.structs * (1 + 2 * self.members + 2 + self.macros)
+
+    def as_dict(self):
+        return dict(vars(self))
+
+def config_for_tags(tags, **kwargs):
+    """
+    a config whose tree has about the given number of tags.
+    """
+
+    config = CorpusConfig(**kwargs)
+    config.headers = max(config.depth, -(-tags // config.tags_per_header()))
+    config.files = max(1, config.headers // 4)
+    return config
+
+def _struct_name(h, k):
+    return 's_%d_%d' % (h, k)
+
+def _header_text(config, rng, h, includes, all_structs):
+    lines = ['#ifndef H_%d_H' % h, '#define H_%d_H' % h, '']
+    for inc in includes:
+        lines.append('#include "h%d.h"' % inc)
+
+    lines.append('')
+    for k in range(config.structs):
+        name = _struct_name(h, k)
+        for j in range(config.macros):
+            lines.append('#define M_%d_%d_%d %d' %
+                         (h, k, j, rng.randrange(1000)))
+
+        lines.append('struct %s {' % name)
+        for j in range(config.members):
+            if j % 3 == 1 and all_structs:
+                lines.append('    struct %s *m_%d;' %
+                             (rng.choice(all_structs), j))
+            elif j % 3 == 2:
+                lines.append('    unsigned long m_%d[%d];' % (j, j + 1))
+            else:
+                lines.append('    int m_%d;' % j)
+
+        lines.append('};')
+        lines.append('typedef struct %s t_%d_%d;' % (name, h, k))
+        lines.append('int f_%d_%d(struct %s *p);' % (h, k, name))
+        lines.append('')
+
+    lines.append('#endif')
+    return '\n'.join(lines) + '\n'
+
+def _source_text(config, rng, n, includes):
+    lines = ['#include "h%d.h"' % inc for inc in includes]
+    lines.append('')
+    for inc in includes:
+        k = rng.randrange(config.structs)
+        lines.append('int use_%d_%d(void)' % (n, inc))
+        lines.append('{')
+        lines.append('    struct %s *p = 0;' % _struct_name(inc, k))
+        lines.append('    t_%d_%d t;' % (inc, k))
+        lines.append('    int i, total = 0;')
+        lines.append('    for (i = 0; i < %d; i++) {' % config.members)
+        lines.append('        total += p->m_0 + t.m_0;')
+        lines.append('    }')
+        lines.append('    return total;')
+        lines.append('}')
+        lines.append('')
+
+    return '\n'.join(lines) + '\n'
+
+def _pick(headers, i, fanout):
+    # the i-th includer takes the next ones in turn, so every header is
+    # included if there are enough includers.
+    return [headers[(i * fanout + j) % len(headers)]
+            for j in range(min(fanout, len(headers)))]
+
+def generate_tree(root, config):
+    """
+    write the tree into root, returns (source files, include dir).
+    """
+
+    rng = random.Random(config.seed)
+    incdir = os.path.join(root, 'include')
+    srcdir = os.path.join(root, 'src')
+    os.makedirs(incdir, exist_ok = True)
+    os.makedirs(srcdir, exist_ok = True)
+
+    levels = [list(range(config.headers))[l::config.depth]
+              for l in range(config.depth)]
+
+    for l, level in enumerate(levels):
+        lower = levels[l + 1] if l + 1 < len(levels) else []
+        lower_structs = [_struct_name(h, k) for h in lower[:50]
+                                            for k in range(config.structs)]
+        for i, h in enumerate(level):
+            includes = _pick(lower, i, config.fanout)
+            path = os.path.join(incdir, 'h%d.h' % h)
+            with open(path, 'w') as fobj:
+                fobj.write(_header_text(config, rng, h, includes,
+                                        lower_structs))
+
+    files = []
+    for n in range(config.files):
+        includes = _pick(levels[0], n, config.fanout)
+        path = os.path.join(srcdir, 'f%d.c' % n)
+        with open(path, 'w') as fobj:
+            fobj.write(_source_text(config, rng, n, includes))
+
+        files.append(path)
+
+    return files, incdir
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("usage: corpus.py DIR TAGS")
+        exit()
+
+    files, incdir = generate_tree(sys.argv[1],
+                                  config_for_tags(int(sys.argv[2])))
+    print(len(files), 'files,', len(os.listdir(incdir)), 'headers')
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""
+The fake_vim module stands in for the "vim" module of vim's python, so
+c_complete can be run outside vim.  install() it before c_complete is
+imported.
+"""
+
+import sys
+
+class Buffer(list):
+
+    def __init__(self, lines = [], name = '', number = 1):
+        list.__init__(self, lines)
+        self.name = name
+        self.number = number
+
+class Window:
+
+    def __init__(self):
+        # the row is 1-based, the col is 0-based.
+        self.cursor = (1, 0)
+
+class Current:
+
+    def __init__(self):
+        self.buffer = Buffer()
+        self.window = Window()
+
+    @property
+    def line(self):
+        return self.buffer[self.window.cursor[0] - 1]
+
+class FakeVim:
+
+    def __init__(self):
+        self.current = Current()
+        self.buffers = []
+        self.changedtick = 0
+
+        # g: variables read by c_complete, the shared server, the cache
+        # file and prebuilt indexes are disabled.
+        self.variables = {'ctags_cache_server': '', 'ctags_cache_file': '',
+                          'ctags_cache_prebuilt_dir': ''}
+
+        self.options = {'tabstop': 8, 'shiftwidth': 4}
+
+    def set_buffer(self, lines, row, col):
+        """
+        edit lines with cursor at (row, col).
+        """
+
+        self.current.buffer[:] = lines
+        self.current.window.cursor = (row, col)
+        self.changedtick += 1
+
+    def eval(self, expr):
+        if expr == "b:changedtick":
+            return str(self.changedtick)
+
+        if expr.startswith('&'):
+            return str(self.options[expr[1:]])
+
+        # "get(g:, 'name', default)", or expand() of it.
+        if "get(g:, '" in expr:
+            name = expr.split("'")[1]
+            if name in self.variables:
+                return str(self.variables[name])
+
+            default = expr.split(',', 2)[2].strip().rstrip(')').strip("'")
+            return default
+
+        if expr.startswith("buflisted("):
+            return '1'
+
+        raise ValueError("fake vim can not eval: " + expr)
+
+    def command(self, cmd):
+        pass
+
+def install():
+    """
+    install a FakeVim as module "vim" and return it.
+    """
+
+    vim = FakeVim()
+    sys.modules['vim'] = vim
+    return vim
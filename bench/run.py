@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+"""
+The run module benchmarks CtagsCache and c_complete on synthetic trees
+generated by the corpus module, and writes the results as JSON, which
+can be compared with results of another commit by compare.py.
+
+run it in the top dir of the plugin, it needs ctags:
+
+    python bench/run.py --sizes 1000,10000,100000,1000000 -o results.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import fake_vim
+from corpus import config_for_tags, generate_tree
+
+VIM = fake_vim.install()
+
+import c_complete
+from ctags_cache import CtagsCache
+from ctags_cache.prebuilt import build_index, index_file
+
+def wait(cache):
+    # a fresh find runs after all pending works.
+    cache.find_tags('', 1, 1)
+
+def timed(func, repeat = 1, setup = None):
+    """
+    the best seconds of running func repeat times, setup is run before
+    each time and not counted.
+    """
+
+    best = None
+    for i in range(repeat):
+        if setup:
+            setup()
+
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+
+    return best
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = BENCH_DIR,
+                              stdout = subprocess.PIPE,
+                              stderr = subprocess.DEVNULL,
+                              universal_newlines = True).stdout.strip()
+    except OSError:
+        return ''
+
+def ctags_version():
+    try:
+        return subprocess.run(['ctags', '--version'],
+                              stdin = subprocess.DEVNULL,
+                              stdout = subprocess.PIPE,
+                              stderr = subprocess.DEVNULL,
+                              universal_newlines = True).stdout.split('\n')[0]
+    except OSError:
+        return ''
+
+def completion_buffer(struct):
+    return ['int bench(void)',
+            '{',
+            '    struct %s *v;' % struct,
+            '    v->',
+            '}']
+
+def complete(line_no, line):
+    """
+    run the omni completion at the end of line, as CComplete() does.
+    """
+
+    lines = list(VIM.current.buffer)
+    lines[line_no - 1] = line
+    VIM.set_buffer(lines, line_no, len(line))
+    start, completion = c_complete.find_completion_start()
+    return c_complete.find_completion_matches(completion, line[start:])
+
+def new_session():
+    """
+    forget the last completion, so the next one is not narrowed from it.
+    """
+
+    c_complete.COMPLETION_START = None
+    c_complete.COMPLETION_SESSION = None
+
+def bench_size(tags, args, rng):
+    config = config_for_tags(tags, fanout = args.fanout, depth = args.depth,
+                             structs = args.structs, members = args.members,
+                             macros = args.macros, seed = args.seed)
+
+    root = tempfile.mkdtemp(prefix = 'ctags_cache_bench_', dir = args.workdir)
+    try:
+        files, incdir = generate_tree(root, config)
+        results = {'tags_target': tags, 'corpus': config.as_dict()}
+
+        prebuilt_dir = None
+        if args.prebuilt:
+            prebuilt_dir = os.path.join(root, 'prebuilt')
+            results['build_index'] = timed(lambda: build_index(
+                    incdir, index_file(prebuilt_dir, incdir), args.jobs))
+
+        cache = CtagsCache('c', [incdir], args.jobs,
+                           prebuilt_dir = prebuilt_dir)
+        c_complete.CTAGS_CACHE = cache
+
+        results['add_files'] = timed(lambda: (cache.add_files(files),
+                                              wait(cache)))
+        results['tags'] = len(cache.find_tags(''))
+
+        # change a header included by many files.
+        header = os.path.join(incdir, 'h0.h')
+        def update():
+            with open(header, 'a') as fobj:
+                fobj.write('#define BENCH_%d 1\n' % rng.randrange(1 << 30))
+
+            cache.update_files([header])
+            wait(cache)
+
+        results['update_files'] = timed(update, args.repeat)
+
+        names = [t['name'] for t in rng.sample(cache.find_tags(''),
+                                                 min(1000, results['tags']))]
+        def find_prefix():
+            for name in names:
+                cache.find_tags(name[:4])
+
+        def find_whole():
+            for name in names:
+                cache.find_tags(name, 1)
+
+        results['find_tags_prefix'] = \
+            timed(find_prefix, args.repeat) / len(names)
+        results['find_tags_whole'] = \
+            timed(find_whole, args.repeat) / len(names)
+
+        # members of a struct, then narrowed by a longer base.  except
+        # the narrowed one, each completion is a new session, so warm
+        # ones find memos of the cache, not matches of the last session.
+        VIM.set_buffer(completion_buffer('s_0_0'), 4, 7)
+        results['completion_cold'] = timed(lambda: complete(4, '    v->'),
+                                           setup = new_session)
+        results['completion_warm'] = \
+            timed(lambda: complete(4, '    v->'), args.repeat, new_session)
+        results['completion_narrow'] = \
+            timed(lambda: complete(4, '    v->m_1'), args.repeat,
+                  lambda: (new_session(), complete(4, '    v->')))
+        results['completion_global'] = \
+            timed(lambda: complete(4, '    f_1'), args.repeat, new_session)
+
+        results['remove_files'] = timed(lambda: (cache.remove_files(files),
+                                                 wait(cache)))
+        return results
+    finally:
+        shutil.rmtree(root)
+
+def main():
+    parser = argparse.ArgumentParser(
+            description = "benchmark ctags_cache on synthetic C trees.")
+    parser.add_argument('--sizes', default = '1000,10000,100000,1000000',
+                        help = "numbers of tags, separated by ','")
+    parser.add_argument('--fanout', type = int, default = 4)
+    parser.add_argument('--depth', type = int, default = 4)
+    parser.add_argument('--structs', type = int, default = 5)
+    parser.add_argument('--members', type = int, default = 8)
+    parser.add_argument('--macros', type = int, default = 2)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--jobs', type = int, default = 0)
+    parser.add_argument('--prebuilt', action = 'store_true',
+                        help = "index the include dir by the prebuilt "
+                               "module before adding files")
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--workdir', default = None)
+    parser.add_argument('-o', '--output', default = '-')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    report = {}
+    report['commit'] = git_commit()
+    report['python'] = platform.python_version()
+    report['ctags'] = ctags_version()
+    report['args'] = vars(args)
+    report['results'] = []
+
+    for tags in [int(s) for s in args.sizes.split(',')]:
+        results = bench_size(tags, args, rng)
+        report['results'].append(results)
+        print('tags %(tags)d: add %(add_files).3fs update %(update_files).3fs '
+              'remove %(remove_files).3fs' % results, file = sys.stderr)
+
+    text = json.dumps(report, indent = 1, sort_keys = True)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w') as fobj:
+            fobj.write(text + '\n')
+
+if __name__ == "__main__":
+    main()
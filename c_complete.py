@@ -2,14 +2,24 @@
 
 import re
 import vim
+import bisect
 
-from ctags_cache import CtagsCache
+from ctags_cache import CtagsCache, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from ctags_cache.server import CtagsCacheClient, default_socket_path
+from ctags_cache.utils import typeref_to_struct_name
+from ctags_cache.c_decl import local_declarations, function_arguments
+from ctags_cache.stats import Stats, format_stats
+from ctags_cache import warm_tier, prebuilt
 
 __all__ = [
     'add_files',
+    'add_buffer',
     'update_files',
     'remove_files', 
     'set_include_list',
+    'save_cache',
+    'print_stats',
+    'progress_text',
     'find_completion_start',
     'find_completion_matches',
 ]
@@ -18,55 +28,56 @@ COMPLETION_RE_OBJ = re.compile(r"(?:\w+\s*(?:\[.*\])*\s*(?:\.|->)\s*)*(\w*)$")
 
 COMPLETION_COMPONENT_RE_OBJ = re.compile(r"(\w+)\s*(?:\[.*\])*\s*(?:\.|->)\s*")
 
-FUNCTION_RE_OBJ = re.compile(r"""(?:static\s+)?
-                                 (?:inline\s+)?
-                                 (?:const\s+)?
-                                 (?:(?:(?:struct|union|enum)\s+)|
-                                    (?:\w+\s+)*)?
-                                 \w+
-                                 [\s\*]+(?:const\s+)?\w+\s*       # function name
-                                 \((.*)\)""",
-                             re.X|re.S)
-
-ARGUMENT_RE_OBJ = re.compile(r"""(?:const\s+)?
-                                 (?:(?:(struct|union|enum)\s+)|
-                                    (?:\w+\s+)*)?
-                                 (\w+)
-                                 [\s\*]+(?:const\s+)?(\w+)\s*""", # argument name
-                             re.X|re.S)
-
-VARIABLE_RE_OBJ = re.compile(r"""(?:static\s+)?
-                                 (?:const\s+)?
-                                 (?:(?:(struct|union|enum)\s+)|
-                                    (?:\w+\s+)*)?
-                                 (\w+)
-                                 ([\s\*]+(?:const\s+)?\w+\s*      # variable name
-                                  (?:\[.*\]\s*)*                  # is it an array?
-                                  (?:=[^;]*)?                     # may have initial value.
-                                  (?:,                            # multiply variables definition.
-                                     [\s\*]*(?:const\s+)?\w+\s*
-                                     (?:\[.*\]\s*)*
-                                     (?:=[^;]*)?)*)
-                                 ;""",
-                             re.X|re.S)
-
-C_TYPES = [ 'char', 'short', 'int', 'long', 'double', 'float' ]
-
-CTAGS_CACHE = CtagsCache('c')
-
-def add_files(files):
-    CTAGS_CACHE.add_files(files)
+# number of ctags processes run in parallel, 0 means one per cpu.
+CTAGS_JOBS = int(vim.eval("get(g:, 'ctags_cache_jobs', 0)"))
 
-def update_files(files):
-    CTAGS_CACHE.update_files(files)
+# update tags of files changed outside vim, e.g. by "git checkout".
+CTAGS_WATCH = int(vim.eval("get(g:, 'ctags_cache_watch', 0)"))
 
-def remove_files(files):
-    CTAGS_CACHE.remove_files(files)
+# limits of tags kept for files no longer included by any buffer.
+WARM_TAGS = int(vim.eval("get(g:, 'ctags_cache_warm_tags', %d)" %
+                         warm_tier.WARM_TAGS))
+WARM_BYTES = int(vim.eval("get(g:, 'ctags_cache_warm_bytes', %d)" %
+                          warm_tier.WARM_BYTES))
 
-def set_include_list(inclist):
-    global CTAGS_CACHE
-    CTAGS_CACHE = CtagsCache('c', inclist)
+# index files of include dirs built by "python -m ctags_cache.prebuilt".
+PREBUILT_DIR = vim.eval("expand(get(g:, 'ctags_cache_prebuilt_dir', '%s'))" %
+                        prebuilt.PREBUILT_DIR)
+
+# tags are saved to this file when vim exits, and loaded at startup.
+# empty string disables it.
+CACHE_FILE = vim.eval("expand(get(g:, 'ctags_cache_file', "
+                      "'~/.cache/ctags_cache/c.cache'))")
+
+# the socket of a shared ctags_cache server, tags are cached in this vim
+# if the server is not running.  empty string disables it.
+SERVER_SOCKET = vim.eval("expand(get(g:, 'ctags_cache_server', '%s'))" %
+                         default_socket_path())
+
+def new_ctags_cache(inclist = [], use_server = 1):
+    cache = None
+    if SERVER_SOCKET and use_server:
+        try:
+            cache = CtagsCacheClient(SERVER_SOCKET, 'c', inclist)
+        except OSError:
+            pass
 
+    if not cache:
+        cache = CtagsCache('c', inclist, CTAGS_JOBS, CTAGS_WATCH,
+                           WARM_TAGS, WARM_BYTES, PREBUILT_DIR)
+
+    if CACHE_FILE:
+        cache.load(CACHE_FILE)
+
+    return cache
+
+INCLUDE_LIST = []
+CTAGS_CACHE = new_ctags_cache()
+
+# time spent by completion in this vim.
+COMPLETION_STATS = Stats()
+
+def listed_files():
     files = []
     for b in vim.buffers:
         if not b.name:
@@ -80,15 +91,129 @@ def set_include_list(inclist):
 
         files.append(b.name)
 
-    CTAGS_CACHE.add_files(files)
+    return files
+
+def use_local_cache():
+    """
+    the server is gone, cache tags of listed buffers in this vim.
+    """
+
+    global CTAGS_CACHE
+    close_cache()
+    CTAGS_CACHE = new_ctags_cache(INCLUDE_LIST, 0)
+    CTAGS_CACHE.add_files(listed_files())
+
+def add_files(files, priority = PRIORITY_BACKGROUND):
+    try:
+        CTAGS_CACHE.add_files(files, priority)
+    except OSError:
+        use_local_cache()
+
+def add_buffer(path):
+    """
+    the buffer is opened to be edited, its tags go before headers still
+    queued by earlier buffers.
+    """
+
+    add_files([path], PRIORITY_INTERACTIVE)
+
+def update_files(files):
+    try:
+        CTAGS_CACHE.update_files(files)
+    except OSError:
+        use_local_cache()
+        CTAGS_CACHE.update_files(files)
+
+def remove_files(files):
+    try:
+        CTAGS_CACHE.remove_files(files)
+    except OSError:
+        use_local_cache()
+
+def close_cache():
+    """
+    stop the threads and ctags processes of a local cache, or disconnect
+    from the server, before CTAGS_CACHE is replaced.
+    """
+
+    try:
+        CTAGS_CACHE.close()
+    except OSError:
+        pass
+
+def save_cache():
+    if CACHE_FILE:
+        try:
+            CTAGS_CACHE.save(CACHE_FILE)
+        except OSError:
+            pass
+
+def print_stats():
+    try:
+        stats = CTAGS_CACHE.stats()
+    except OSError:
+        stats = {}
+
+    # the cache may be in the shared server.
+    stats['server'] = int(not isinstance(CTAGS_CACHE, CtagsCache))
+    for line in format_stats(stats) + \
+                format_stats(COMPLETION_STATS.as_dict()):
+        print(line)
+
+def progress_text():
+    """
+    e.g. "ctags 120/480 files, 3s left" while headers are being parsed,
+    otherwise empty, for the statusline.
+    """
+
+    try:
+        progress = CTAGS_CACHE.progress()
+    except OSError:
+        return ''
+
+    if not progress:
+        return ''
+
+    text = 'ctags %(done)d/%(total)d files' % progress
+    if progress['eta'] is not None:
+        text += ', %ds left' % round(progress['eta'])
+
+    return text
+
+def set_include_list(inclist):
+    global CTAGS_CACHE, INCLUDE_LIST
+    save_cache()
+    close_cache()
+
+    INCLUDE_LIST = inclist
+    CTAGS_CACHE = new_ctags_cache(inclist)
+
+    # headers nearest to the current buffer are parsed first, the tags
+    # are found as soon as each chunk of them is parsed.
+    files = listed_files()
+    current = vim.current.buffer.name
+    if current in files:
+        files.remove(current)
+        add_files([current], PRIORITY_INTERACTIVE)
+
+    add_files(files)
+
+# (buffer number, row, start col) of the last completion.
+COMPLETION_START = None
+
+# (key, base, matches) of the last completion, its matches are narrowed
+# if the completion is continued with a longer base.
+COMPLETION_SESSION = None
 
 def find_completion_start():
+    global COMPLETION_START
     row, col = vim.current.window.cursor
 
     # the pattern matches string like this: 'abc[10].def->ghi', 'abc',
     # etc.
     match = COMPLETION_RE_OBJ.search(vim.current.line[0:col])
 
+    COMPLETION_START = (vim.current.buffer.number, row, match.start(1))
     return match.start(1), match.group(0)
 
 def line_is_end(line):
@@ -103,9 +228,7 @@ def line_is_end(line):
     else:
         return 0
 
-def line_indent_level(line):
-    tab_stop = int(vim.eval("&tabstop"))
-    shift_width = int(vim.eval("&shiftwidth"))
+def line_indent_level(line, tab_stop, shift_width):
     prefix_space = 0
     for i in range(0, len(line)):
         if line[i] == ' ':
@@ -117,128 +240,257 @@ def line_indent_level(line):
 
     return prefix_space // shift_width
 
-def split_var_names(s):
-    s = re.sub(r"'(?:.|\\.)'", '', s)
-    s = re.sub(r'\\.', '', s)
-    s = re.sub(r'"[^"]*"', '', s)
+def cached(cache, func, key):
+    res = cache.get(key)
+    if res is None:
+        # statements of all buffers are cached, do not grow for ever.
+        if len(cache) > 20000:
+            cache.clear()
 
-    for p in [r'\{[^\{]*\}', r'\([^\(]*\)', r'\[[^\[]*\]']:
-        while 1:
-            t = re.sub(p, '', s)
-            if s != t:
-                s = t
-            else:
-                break
+        res = cache[key] = list(func(key))
 
-    s = re.sub(r'=[^,]*', '', s)
-    s = re.sub(r'[\s\*]', '', s)
+    return res
 
-    return s.split(',')
+class BufferScopeIndex:
+    """
+    the braces and local declarations of one buffer at one changedtick.
 
-def var_names(statements):
-    it = VARIABLE_RE_OBJ.finditer(statements)
-    for st in it:
-        typename = ''
-        if st.group(1):
-            typename = st.group(1) + ':' + st.group(2)
-        elif st.group(2) not in C_TYPES:
-            typename = st.group(2)
+    the index of the previous changedtick is reused, only lines between
+    the common prefix and suffix of both are scanned again, braces after
+    them are shifted.  braces of each line are cached by the line text,
+    the declarations are cached by the statement text, so after a change
+    only the changed lines and statements are parsed again.
+    """
 
-        for var in split_var_names(st.group(3)):
-            if typename:
-                yield {'name': var, 'typeref': typename}
-            else:
-                yield {'name': var}
-
-def arg_names(st):
-    it = ARGUMENT_RE_OBJ.finditer(st)
-    for arg in it:
-        tag = {'name': arg.group(3)}
-        if arg.group(1):
-            tag['typeref'] = arg.group(1) + ':' + arg.group(2)
-        elif arg.group(2) not in C_TYPES:
-            tag['typeref'] = arg.group(2)
-            
-        yield tag
+    # line text -> (braces, is_end), braces are [(col, char), ...].
+    _lines_cache = {}
 
-def get_local_vars(name_prefix, match_whole = 0):
-    if not match_whole:
-        matcher = lambda x: x.startswith(name_prefix)
-    else:
-        matcher = lambda x: x == name_prefix
+    # statement text -> local variables, function header -> arguments.
+    _vars_cache = {}
+    _args_cache = {}
 
-    origin_row, origin_col = vim.current.window.cursor
+    def __init__(self, lines, changedtick, tab_stop, shift_width,
+                 prev = None):
+        self.lines = lines
+        self.changedtick = changedtick
+        self._tab_stop = tab_stop
+        self._shift_width = shift_width
+        self._scope_vars = {}
 
-    res = []
-    while 1:
-        end_row, end_col = vim.current.window.cursor
-        vim.eval("searchpair('{', '', '}', 'bW', '')")
-        start_row, start_col = vim.current.window.cursor
-        if start_col == end_col and start_row == end_row:
-            break
+        # positions and chars of all braces, and after each of them, the
+        # innermost open brace which is not closed yet, -1 means no one.
+        self._positions = []
+        self._chars = []
+        self._enclosing = []
 
-        # the row of vim window cursor is start from 1, col is start
-        # from 0.  but, we assume symbol '{' and '}' always at the end
-        # of previous scope.
-        if start_row == end_row:
-            scope = [vim.current.buffer[start_row]]
-        else:
-            scope = vim.current.buffer[start_row:end_row]
+        # open braces as (row, col, enclosing open brace).
+        self._opens = []
 
-        scope[-1] = scope[-1][:end_col]
+        if prev is None:
+            self._scan_rows(0, len(lines), [])
+        else:
+            self._update(prev)
+
+    def _add_brace(self, row, col, char, stack):
+        if char == '{':
+            self._opens.append((row, col, stack[-1] if stack else -1))
+            stack.append(len(self._opens) - 1)
+        elif stack:
+            stack.pop()
+
+        self._positions.append((row, col))
+        self._chars.append(char)
+        self._enclosing.append(stack[-1] if stack else -1)
+
+    def _scan_rows(self, start, end, stack):
+        for row in range(start, end):
+            for col, char in self._scan(self.lines[row])[0]:
+                self._add_brace(row, col, char, stack)
+
+    def _update(self, prev):
+        old, new = prev.lines, self.lines
+        size = min(len(old), len(new))
+        start = 0
+        while start < size and old[start] == new[start]:
+            start += 1
+
+        end = 0
+        while end < size - start and old[-1 - end] == new[-1 - end]:
+            end += 1
+
+        # braces before the change are kept as they are.
+        first = bisect.bisect_left(prev._positions, (start, -1))
+        self._positions = prev._positions[:first]
+        self._chars = prev._chars[:first]
+        self._enclosing = prev._enclosing[:first]
+        self._opens = prev._opens[:bisect.bisect_left(prev._opens,
+                                                      (start, -1))]
+
+        # open braces not closed before the change.
+        stack = []
+        opening = self._enclosing[-1] if self._enclosing else -1
+        while opening >= 0:
+            stack.insert(0, opening)
+            opening = self._opens[opening][2]
+
+        self._scan_rows(start, len(new) - end, stack)
+
+        # braces after the change are shifted, which open braces enclose
+        # them may be changed.
+        last = bisect.bisect_left(prev._positions, (len(old) - end, -1))
+        delta = len(new) - len(old)
+        for i in range(last, len(prev._positions)):
+            row, col = prev._positions[i]
+            self._add_brace(row + delta, col, prev._chars[i], stack)
+
+    def _scan(self, line):
+        res = self._lines_cache.get(line)
+        if res is None:
+            if len(self._lines_cache) > 20000:
+                self._lines_cache.clear()
+
+            braces = [(col, char) for col, char in enumerate(line)
+                                  if char in '{}']
+            res = self._lines_cache[line] = (braces, line_is_end(line))
+
+        return res
+
+    def _indent_level(self, line):
+        return line_indent_level(line, self._tab_stop, self._shift_width)
+
+    def _enclosing_open(self, row, col):
+        i = bisect.bisect_left(self._positions, (row, col)) - 1
+        return self._enclosing[i] if i >= 0 else -1
+
+    def _vars_in_scope(self, opening, end_row, end_col):
+        """
+        local variables declared in the scope of an open brace, before
+        (end_row, end_col).  statements of nested scopes are skipped by
+        their indent.
+        """
+
+        key = (opening, end_row, end_col)
+        res = self._scope_vars.get(key)
+        if res is not None:
+            return res
+
+        start_row, start_col, parent = self._opens[opening]
+
+        # we assume symbol '{' and '}' always at the end of previous scope.
+        scope = self.lines[start_row + 1:end_row + 1]
+        if scope:
+            scope[-1] = scope[-1][:end_col]
 
         # the indent level of scope is decided by the line which include
         # '{'.  indent level of this line plus 1 is scope indent level.
-        scope_ind_lev = line_indent_level(vim.current.buffer[start_row - 1]) + 1
+        scope_ind_lev = self._indent_level(self.lines[start_row]) + 1
 
+        res = []
         statements = ''
         for line in scope:
-            statements += line;
+            statements += line
 
-            if line_is_end(line):
+            if self._scan(line)[1]:
                 # now we got a complete statements.
-                st_ind_lev = line_indent_level(statements)
-                if scope_ind_lev >= st_ind_lev:
-                    for var in var_names(statements):
-                        if matcher(var['name']) and var not in res:
-                            res.append(var)
+                if scope_ind_lev >= self._indent_level(statements):
+                    res += cached(self._vars_cache, local_declarations,
+                                  statements)
 
                 statements = ''
 
-        # whether in the function header. if yes, parse arguments and
-        # break whole "while 1" loop.
-        if scope_ind_lev == 1:
+        self._scope_vars[key] = res
+        return res
+
+    def _function_args(self, opening):
+        """
+        arguments in the function header before an open brace.
+        """
+
+        start_row, start_col, parent = self._opens[opening]
+        statements = self.lines[start_row][:start_col]
+        while 1:
+            if statements not in self._args_cache:
+                if len(self._args_cache) > 20000:
+                    self._args_cache.clear()
+
+                self._args_cache[statements] = function_arguments(statements)
+
+            args = self._args_cache[statements]
+            if args is not None:
+                return args
+
             start_row -= 1
-            statements = vim.current.buffer[start_row][:start_col]
-            while 1:
-                func = FUNCTION_RE_OBJ.search(statements)
-                if func:
-                    for arg in arg_names(func.group(1)):
-                        if matcher(arg['name']) and arg not in res:
-                            res.append(arg)
-                    break
-
-                start_row -= 1
-                if start_row >= 0 and \
-                   not line_is_end(vim.current.buffer[start_row]):
-                    statements = vim.current.buffer[start_row] + statements
-                else:
-                    break
+            if start_row >= 0 and not self._scan(self.lines[start_row])[1]:
+                statements = self.lines[start_row] + statements
+            else:
+                return []
 
-            break
+    def local_vars(self, row, col):
+        """
+        local variables and arguments visible at (row, col), both are
+        0-based, the innermost first.
+        """
+
+        res = []
+        opening = self._enclosing_open(row, col)
+        while opening >= 0:
+            res += self._vars_in_scope(opening, row, col)
+
+            # whether in the function header. if yes, parse arguments and
+            # stop.
+            row, col, parent = self._opens[opening]
+            if self._indent_level(self.lines[row]) == 0:
+                res += self._function_args(opening)
+                break
+
+            opening = parent
+
+        return res
+
+# buffer number -> BufferScopeIndex of recently completed buffers.
+SCOPE_INDEXES = {}
+
+def buffer_scope_index():
+    buf = vim.current.buffer
+    changedtick = int(vim.eval("b:changedtick"))
+    index = SCOPE_INDEXES.get(buf.number)
+    if not index or index.changedtick != changedtick:
+        if not index and len(SCOPE_INDEXES) >= 8:
+            del SCOPE_INDEXES[next(iter(SCOPE_INDEXES))]
+
+        index = BufferScopeIndex(buf[:], changedtick,
+                                 int(vim.eval("&tabstop")),
+                                 int(vim.eval("&shiftwidth")), index)
+        SCOPE_INDEXES.pop(buf.number, None)
+        SCOPE_INDEXES[buf.number] = index
+
+    return index
+
+def get_local_vars(name_prefix, match_whole = 0):
+    if not match_whole:
+        matcher = lambda x: x.startswith(name_prefix)
+    else:
+        matcher = lambda x: x == name_prefix
+
+    row, col = vim.current.window.cursor
 
-    vim.current.window.cursor = origin_row, origin_col
+    res = []
+    with COMPLETION_STATS.timer('local_vars_time'):
+        for var in buffer_scope_index().local_vars(row - 1, col):
+            if matcher(var['name']) and var not in res:
+                res.append(var)
 
     return res
 
-def find_typeref_of_typedef(typedef):
+def _find_typeref_of_typedef(cache, typedef):
     """
     translate typedefed type to original typeref.  if original typeref
     is not struct or union, it will return string ''.
     """
+
     typename = ''
     while 1:
-        tags = CTAGS_CACHE.find_tags(typedef, 1)
+        tags = cache.find_tags(typedef, 1)
         tags = [t for t in tags 
                    if (t['kind'] == 't' and 'typeref' in t) or \
                       (t['kind'] == 'c')]
@@ -259,51 +511,90 @@ def find_typeref_of_typedef(typedef):
 
     return typename
 
-def typeref_to_struct_name(typeref):
+def _typeref_to_struct(cache, typeref):
+    if not typeref.startswith("struct:") and \
+       not typeref.startswith("union:") and \
+       not typeref.startswith("class:"):
+        typeref = _find_typeref_of_typedef(cache, typeref)
+        # if typeref can not convert to a struct or union, stop.
+        if not typeref:
+            return ''
+
+    return typeref_to_struct_name(typeref)
+
+def _find_component_struct(cache, last_struct, component):
+    if not last_struct:
+        tags = cache.find_tags(component, 1)
+        tags = [t for t in tags
+                  if t['kind'] == 'v' and 'typeref' in t]
+    else:
+        if last_struct.startswith("struct:") or \
+           last_struct.startswith("union:") or \
+           last_struct.startswith("class:"):
+               kind, sep, name = last_struct.partition(':')
+        else:
+            name = last_struct
+
+        tags = cache.find_members(name)
+        tags = [t for t in tags \
+                  if t['kind'] in 'fmpt' and \
+                     'typeref' in t and \
+                     t['name'].rpartition('::')[2] == component]
+
+    # no tags found, stop.
+    if not tags:
+        return ''
+
+    # if there are more than one tags, just use the first one.
+    return _typeref_to_struct(cache, tags[0]['typeref'])
+
+def find_component_struct(last_struct, component):
     """
-    the 'typeref' field is generated by ctags, it may contain many
-    middle struct name, we don't need them. but, the "__anon*" struct is
-    useful, should keep it.
+    the struct of component, which is a member of last_struct, or a
+    global variable if last_struct is ''.  it returns '' if the struct is
+    unknown.
     """
-    kind, sep, name = typeref.partition(':')
-    name_parts = name.split('::')
-    name_parts.reverse()
-    name = []
-    for s in name_parts:
-        name.insert(0, s)
-        if not s.startswith('__anon'):
-            break
 
-    return kind + sep + "::".join(name)
+    return CTAGS_CACHE.lookup(
+            ('component', last_struct, component),
+            lambda cache: _find_component_struct(cache, last_struct,
+                                                 component))
 
-def is_not_member_of_named_child_struct(tag, struct_name, struct_tags):
-    kind = None
-    if 'struct' in tag:
-        kind = 'struct'
-    elif 'union' in tag:
-        kind = 'union'
-    elif 'class' in tag:
-        kind = 'class'
+def match_base(tag, base, context):
+    if context:
+        return tag['name'].rpartition('::')[2].startswith(base)
 
-    # unlikely.
-    else:
-        return 0
-    
-    # tag is member of struct.
-    if tag[kind] == struct_name:
-        return 1
+    return tag['name'].startswith(base)
 
-    for t2 in struct_tags:
-        if tag == t2 or 'typeref' not in t2:
-            continue
+def find_completion_matches(completion, base):
+    global COMPLETION_SESSION
+
+    # e.g. 'abc[10].def->' of 'abc[10].def->gh'.
+    context = completion[:len(completion) - len(base)]
+    timer = COMPLETION_STATS.timer('completion_time')
+    try:
+        with timer:
+            key = (COMPLETION_START, context, CTAGS_CACHE.generation())
+            session = COMPLETION_SESSION
+            if session and session[0] == key and \
+               base.startswith(session[1]):
+                COMPLETION_STATS.count('completions_narrowed')
+                matches = [m for m in session[2]
+                             if match_base(m, base, context)]
+            else:
+                matches = _find_completion_matches(completion, base)
 
-        # the parent struct found, tag is not member of struct.
-        if kind + ':' + tag[kind] == typeref_to_struct_name(t2['typeref']):
-            return 0
+    except OSError:
+        use_local_cache()
+        key = None
+        matches = _find_completion_matches(completion, base)
 
-    return 1
+    # nothing is searched without a completion, so there is nothing to
+    # narrow, though the start of the next one is the same.
+    COMPLETION_SESSION = (key, base, matches) if completion else None
+    return matches
 
-def find_completion_matches(completion, base):
+def _find_completion_matches(completion, base):
     if not completion:
         return []
 
@@ -312,46 +603,23 @@ def find_completion_matches(completion, base):
         last_struct = ''
         last_component_start = 0
         for part in it:
-            tags = None
+            component = part.group(1)
+            tags = []
             if not last_struct:
-                tags = [t for t in get_local_vars(part.group(1), 1)
+                tags = [t for t in get_local_vars(component, 1)
                           if 'typeref' in t]
-                if not tags:
-                    tags = CTAGS_CACHE.find_tags(part.group(1), 1)
-                    tags = [t for t in tags
-                              if t['kind'] == 'v' and 'typeref' in t]
-            else:
-                if last_struct.startswith("struct:") or \
-                   last_struct.startswith("union:") or \
-                   last_struct.startswith("class:"):
-                       kind, sep, name = last_struct.partition(':')
-                else:
-                    name = last_struct
-
-                tags = CTAGS_CACHE.find_tags(name + '::')
-                tags = [t for t in tags \
-                          if t['kind'] in 'fmpt' and \
-                             'typeref' in t and \
-                             t['name'].rpartition('::')[2] == part.group(1) and \
-                             is_not_member_of_named_child_struct(t, name, tags)]
-
-            # no tags found, stop.
-            if not tags:
-                return []
 
-            # if there are more than one tags, just use the first one.
-            t = tags[0]
-            if t['typeref'].startswith("struct:") or \
-               t['typeref'].startswith("union:") or \
-               t['typeref'].startswith("class:"):
-                typeref = t['typeref']
+            if tags:
+                typeref = tags[0]['typeref']
+                last_struct = CTAGS_CACHE.lookup(
+                        ('typeref', typeref),
+                        lambda cache: _typeref_to_struct(cache, typeref))
             else:
-                typeref = find_typeref_of_typedef(t['typeref'])
-                # if typeref can not convert to a struct or union, stop.
-                if not typeref:
-                    return []
+                last_struct = find_component_struct(last_struct, component)
+
+            if not last_struct:
+                return []
 
-            last_struct = typeref_to_struct_name(typeref)
             last_component_start = part.end(0)
 
         last_component = completion[last_component_start:]
@@ -363,11 +631,10 @@ def find_completion_matches(completion, base):
         else:
             name = last_struct
 
-        tags = CTAGS_CACHE.find_tags(name + '::')
+        tags = CTAGS_CACHE.find_members(name)
         tags = [t for t in tags \
                   if t['kind'] in 'fmpt' and \
-                     t['name'].rpartition('::')[2].startswith(last_component) and \
-                     is_not_member_of_named_child_struct(t, name, tags)]
+                     t['name'].rpartition('::')[2].startswith(last_component)]
 
         return tags
 
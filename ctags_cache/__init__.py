@@ -3,83 +3,271 @@
 __all__ = ['CtagsCache']
 
 import os
+import time
+import heapq
+import pickle
 import threading
+import traceback
 
-from .file_node import get_file_class
+from .file_node import get_file_class, IncludeResolver
 from .ctags_table import CtagsTable
+from .include_graph import IncludeGraph
+from .watcher import new_watcher
+from .warm_tier import WarmTier, WARM_TAGS, WARM_BYTES
+from .prebuilt import index_file
+from .stats import Stats
+
+# priorities of works, the smaller runs first.  the buffer being edited
+# and completion queries are interactive, ingestion of header files is
+# background, and idle works run after all others.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_IDLE = 2
+
+# number of new files whose tags are added at once, a snapshot is
+# published after each chunk, so finds see the nearest headers first
+# while the others are being parsed.
+INGEST_CHUNK = 64
 
 class CtagsCacheWorker(threading.Thread):
+    """
+    runs works of a CtagsCache in a thread.
 
-    def __init__(self):
+    file works are keyed by path: all pending add, update and remove of a
+    path are collapsed into one net work, which is passed to
+    handler(path, delta, dirty, priority).  delta is the number of adds
+    minus the number of removes, dirty means the file should be updated.
+
+    works run by (priority, sequence) order, a collapsed work keeps its
+    sequence and takes the highest priority of its parts.
+    """
+
+    def __init__(self, handler, stats = None):
         threading.Thread.__init__(self)
         self.daemon = True
+        self._handler = handler
+        self._stats = stats or Stats()
         self._works_cond = threading.Condition()
-        self._works = []
-        self._barrier = 0
+        self._works = {}
+        self._queue = []
+        self._seq = 0
+        self._closed = 0
+        self._release = None
         self.start()
 
-    def add_work(self, new):
+    def _push(self, key, work):
+        heapq.heappush(self._queue, (work['priority'], work['seq'], key))
+        self._works_cond.notify()
+
+    def pending(self, calls = 1):
+        """
+        the number of works waiting, not counting functions to call
+        unless calls.
+        """
+
         with self._works_cond:
-            if new['op'] == 'wait_all_complete':
-                self._barrier = 1
-                self._works.append(new)
-                self._works_cond.notify()
-                self._works_cond.wait_for(lambda: not self._barrier)
+            if calls:
+                return len(self._works)
 
-            else:
-                dup = None
-                for w in self._works:
-                    if w['target'] != new['target']:
-                        continue
-
-                    elif (new['op'] == 'add' and w['op'] == 'remove') or \
-                         (new['op'] == 'remove' and w['op'] == 'add') or \
-                         (new['op'] == 'update' and w['op'] == 'update'):
-                        dup = w
-
-                if dup:
-                    self._works.remove(dup)
-                else:
-                    self._works.append(new)
+            return sum(1 for key in self._works if isinstance(key, str))
 
-                self._works_cond.notify()
+    def schedule(self, op, path, priority):
+        with self._works_cond:
+            if self._closed:
+                return
+
+            self._stats.observe('queue_depth', len(self._works))
+            work = self._works.get(path)
+            if not work:
+                self._seq += 1
+                work = {}
+                work['target'] = path
+                work['priority'] = priority
+                work['seq'] = self._seq
+                work['delta'] = 0
+                work['dirty'] = 0
+                self._works[path] = work
+                self._push(path, work)
+
+            elif priority < work['priority']:
+                work['priority'] = priority
+                self._push(path, work)
+
+            if op == 'add':
+                work['delta'] += 1
+            elif op == 'remove':
+                work['delta'] -= 1
+            elif op == 'update':
+                work['dirty'] = 1
+
+            # e.g. an add and a remove cancel each other.
+            if not work['delta'] and not work['dirty']:
+                del self._works[path]
+
+    def call(self, func, priority, wait = 1):
+        """
+        run func() after all works which have higher or the same priority
+        and are scheduled before it.  if wait, block until func returned
+        and return its result.
+        """
+
+        with self._works_cond:
+            if self._closed:
+                return None
+
+            self._seq += 1
+            key = ('call', self._seq)
+            work = {}
+            work['run'] = func
+            work['priority'] = priority
+            work['seq'] = self._seq
+            work['done'] = 0
+            work['result'] = None
+            self._works[key] = work
+            self._push(key, work)
+
+            if wait:
+                with self._stats.timer('wait_time'):
+                    self._works_cond.wait_for(lambda: work['done'])
+
+            return work['result']
+
+    def _pop(self):
+        while 1:
+            self._works_cond.wait_for(lambda: self._queue or self._closed)
+            if self._closed:
+                return None
+
+            priority, seq, key = heapq.heappop(self._queue)
+
+            # the entry is stale if the work is cancelled or reprioritized.
+            work = self._works.get(key)
+            if work and work['priority'] == priority and work['seq'] == seq:
+                del self._works[key]
+                return work
 
     def run(self):
         while 1:
             with self._works_cond:
-                self._works_cond.wait_for(lambda: self._works)
-
-                work = None
-                if self._barrier:
-                    for w in self._works:
-                        w['run']()
+                work = self._pop()
 
-                    self._works = []
-                    self._barrier = 0
+            if not work:
+                break
 
+            try:
+                if 'run' in work:
+                    work['result'] = work['run']()
                 else:
-                    work = self._works.pop(0)
+                    with self._stats.timer('work_time'):
+                        self._handler(work['target'], work['delta'],
+                                      work['dirty'], work['priority'])
+            except Exception:
+                traceback.print_exc()
+
+            if 'run' in work:
+                with self._works_cond:
+                    work['done'] = 1
+                    self._works_cond.notify_all()
+
+        if self._release:
+            self._release()
+
+    def close(self, release = None):
+        """
+        cancel the works waiting, callers waiting for them get None.  the
+        thread exits after the running work, then runs release().
+        """
 
-                self._works_cond.notify()
+        with self._works_cond:
+            self._closed = 1
+            self._release = release
+            for work in self._works.values():
+                if 'run' in work:
+                    work['done'] = 1
+
+            self._works.clear()
+            self._queue.clear()
+            self._works_cond.notify_all()
+
+_MISSING = object()
+
+class LookupRecorder:
+    """
+    passed to the function of CtagsCache.lookup() in place of the cache,
+    it records the names and scopes which the function looked up.
+    """
+
+    def __init__(self, view):
+        self._view = view
+        self.names = set()
+        self.scopes = set()
+
+        # the result depends on a prefix, it can not be memoized.
+        self.volatile = 0
+
+    def find_tags(self, name_prefix, match_whole = 0, fresh = 0):
+        if match_whole:
+            self.names.add(name_prefix)
+        else:
+            self.volatile = 1
+
+        return self._view.find(name_prefix, match_whole)
 
-            if work:
-                work['run']()
+    def find_members(self, scope, fresh = 0):
+        self.scopes.add(scope)
+        return self._view.members(scope)
 
 class FileTypeError(Exception):
     pass
 
+# bump it whenever the format of saved cache file is changed.
+CACHE_VERSION = 3
+
 class CtagsCache:
 
-    def __init__(self, filetype, inclist = []):
-        self._worker = CtagsCacheWorker()
+    def __init__(self, filetype, inclist = [], jobs = 0,
+                 watch = 0, warm_tags = WARM_TAGS, warm_bytes = WARM_BYTES,
+                 prebuilt_dir = None):
+        """
+        if watch, files changed outside vim are updated by a file watcher.
+
+        if the index file of an include dir is in prebuilt_dir, see the
+        prebuilt module, headers in the dir are not parsed by ctags.
+
+        tags of files which are no longer included by any added file are
+        kept in a warm tier, limited by warm_tags and warm_bytes, then
+        they are not parsed again if the files are added back unchanged.
+        """
+
+        self._stats = Stats()
+        self._worker = CtagsCacheWorker(self._run_work, self._stats)
+        self._watcher = None
         self._file_nodes = {}
-        self._ctags_table = CtagsTable()
+        self._include_graph = IncludeGraph()
+        self._saved_nodes = {}
+        self._warm_tier = WarmTier(warm_tags, warm_bytes)
         self._init_inc_list(inclist)
+
+        prebuilt = []
+        if prebuilt_dir:
+            prebuilt = [index_file(prebuilt_dir, d) for d in self._inc_list]
+
+        self._ctags_table = CtagsTable(jobs, self._stats,
+                                       [p for p in prebuilt
+                                        if os.path.exists(p)])
+        self._snapshot = self._ctags_table.snapshot()
+        self._init_memo()
+        self._init_ingest()
         self._file_class = get_file_class(filetype)
 
         if not self._file_class:
             raise FileTypeError
 
+        if watch:
+            self._watcher = new_watcher(
+                    lambda pathes: self.update_files(pathes,
+                                                     PRIORITY_BACKGROUND))
+
     def _init_inc_list(self, inclist):
         self._inc_list = []
         for path in inclist:
@@ -87,164 +275,554 @@ class CtagsCache:
             if path not in self._inc_list:
                 self._inc_list.append(path)
 
+        self._resolver = IncludeResolver(self._inc_list)
+
     def _get_node(self, path, create_new = 0):
+        """
+        return the node of path, or None if it is not created yet, or can
+        not be created since the file can not be read.
+        """
+
         node = None
         if path in self._file_nodes:
             node = self._file_nodes[path]
         elif create_new:
-            node = self._file_class(path, self._inc_list)
+            saved = self._saved_nodes.pop(path, None)
+            if path in self._warm_tier:
+                self._warm_tier.discard(path)
+                self._stats.count('files_revived')
+
+            try:
+                with self._stats.timer('include_scan_time'):
+                    node = self._file_class(path, self._resolver, saved)
+            except OSError:
+                # e.g. removed, or a dangling symlink.
+                self._ctags_table.forget(path)
+                return None
+
             self._file_nodes[path] = node
+            self._stats.observe('bytes_per_file', node.fingerprint[1])
+
+            # the saved tags are out of date.
+            if not saved or saved[0][2] != node.fingerprint[2]:
+                self._ctags_table.forget(path)
 
         return node
 
-    def _add_file_recursively(self, path):
+    def _load_depends(self, path):
         node = self._get_node(path, 1)
-        if node.refcount <= 0:
-            node.refcount = 1
-            node.check_loop = 1
-
-            new_files = [path]
-            for f in node.depends:
-                new_files += self._add_file_recursively(f)
-
-            node.check_loop = 0
-            return new_files
-        elif not node.check_loop:
-            node.refcount += 1
-            return []
-        else:
-            return []
+        return node.depends if node else None
+
+    def _watch_nodes(self, new_files):
+        if self._watcher:
+            self._watcher.add_paths(new_files)
+
+    def _drop_nodes(self, obsolete_files):
+        """
+        delete the files which are no longer included, they are moved to
+        the warm tier like the ones loaded from a cache file.
+        """
+
+        self._unqueue(obsolete_files)
+        nodes = [self._file_nodes.pop(path) for path in obsolete_files]
+        if self._watcher:
+            self._watcher.remove_paths(obsolete_files)
+
+        counts = self._ctags_table.delete(obsolete_files, 1)
+        for node in nodes:
+            self._saved_nodes[node.path] = (node.fingerprint, node.depends,
+                                            node.include_digest)
+
+            # files which have no tags in memory, e.g. prebuilt ones, take
+            # no room.
+            kept = node.path in counts
+            evicted = self._warm_tier.retire(node.path,
+                                             counts.get(node.path, 0),
+                                             node.fingerprint[1] if kept
+                                             else 0)
+            for path in evicted:
+                del self._saved_nodes[path]
+                self._ctags_table.forget(path)
+
+            self._stats.count('files_evicted', len(evicted))
+
+    def _add_file(self, path, priority):
+        path = os.path.realpath(path)
+        if not os.access(path, os.R_OK):
+            return
+
+        self._stats.count('files_added')
+        new_files = self._include_graph.add_root(path, self._load_depends)
+        self._watch_nodes(new_files)
+        self._ingest(self._urgent_files(path, priority) + new_files,
+                     priority)
+
+    def _update_file(self, path, priority):
+        path = os.path.realpath(path)
+        if not os.access(path, os.R_OK):
+            self._lose_file(path, priority)
+            return
 
-    def _remove_file_recursively(self, path):
         node = self._get_node(path)
         if not node:
-            return []
+            return
+
+        self._stats.count('files_updated')
+        with self._stats.timer('include_scan_time'):
+            content_changed, includes_changed = node.renew(self._resolver)
+
+        if not content_changed:
+            return
+
+        new_files = [path]
+        self._ctags_table.delete([path])
+        if includes_changed:
+            new, obsolete = self._include_graph.set_depends(
+                    path, node.depends, self._load_depends)
+            self._watch_nodes(new)
+            self._drop_nodes(obsolete)
+            new_files += new
+
+        self._ingest(self._urgent_files(path, priority) + new_files,
+                     priority)
+
+    def _lose_file(self, path, priority):
+        """
+        path is removed or can not be read any more, e.g. by "git
+        checkout".  its tags are dropped, and the files including it
+        resolve their includes again, which drops it from the graph, or
+        finds the header in another dir.
+        """
+
+        node = self._get_node(path)
+        self._ctags_table.delete([path])
+        self._ctags_table.forget(path)
+        if not node:
+            return
 
-        if node.refcount == 0:
-            # impossible!
-            print("what the fuck?!")
+        self._stats.count('files_updated')
+        self._unqueue([path])
+
+        # parsed again if it comes back while it is still live, e.g. it
+        # is a root.
+        node.fingerprint = (None, 0, None)
+
+        new_files = []
+        for includer in sorted(self._include_graph.dependents(path)):
+            # the includer may be changed too, then its tags are updated
+            # before its fingerprint is renewed below.
+            self._update_file(includer, priority)
+            includer_node = self._get_node(includer)
+            if not includer_node:
+                continue
+
+            try:
+                with self._stats.timer('include_scan_time'):
+                    includer_node.renew_depends(self._resolver)
+            except OSError:
+                continue
+
+            new, obsolete = self._include_graph.set_depends(
+                    includer, includer_node.depends, self._load_depends)
+            self._watch_nodes(new)
+            self._drop_nodes(obsolete)
+            new_files += new
+
+        self._ingest(new_files, priority)
+
+    def _urgent_files(self, path, priority):
+        """
+        path and the headers it includes directly which are still queued
+        by earlier works, they are requeued at the interactive priority,
+        since the buffer is being edited.
+        """
+
+        if priority != PRIORITY_INTERACTIVE:
             return []
-        elif node.refcount > 1:
-            node.refcount -= 1
+
+        node = self._get_node(path)
+        if not node:
             return []
 
-        node.refcount = 0
-        del self._file_nodes[path]
+        return [f for f in [path] + sorted(node.depends) if f in self._pending]
 
-        obsolete_files = [path]
-        for f in node.depends:
-            obsolete_files += self._remove_file_recursively(f)
+    def _remove_file(self, path):
+        path = os.path.realpath(path)
+        self._stats.count('files_removed')
+        self._drop_nodes(self._include_graph.remove_root(path))
+
+    def _run_work(self, path, delta, dirty, priority):
+        self._resolver.refresh()
+
+        # update first, then the added file will be parsed only once if
+        # it is new.
+        if dirty:
+            self._update_file(path, priority)
+
+        for i in range(delta):
+            self._add_file(path, priority)
+
+        for i in range(-delta):
+            self._remove_file(path)
+
+        self._publish()
+
+    def _init_ingest(self):
+        # live files whose tags are not added yet: path -> its entry in
+        # the heap of (priority, sequence, path).
+        self._pending = {}
+        self._pending_heap = []
+        self._pending_seq = 0
+        self._chunk_scheduled = 0
+
+        # (files done, files total, start time) since all works were
+        # completed last time.
+        self._progress = None
+
+    def _ingest(self, pathes, priority):
+        """
+        add tags of pathes, the first chunk is added at once, others are
+        added by later works, so works scheduled meanwhile are not blocked
+        until all of them are parsed.
+        """
+
+        done, total, start = self._progress or (0, 0, time.time())
+        for path in pathes:
+            entry = self._pending.get(path)
+            if entry and entry[0] <= priority:
+                continue
+
+            if not entry:
+                total += 1
+
+            self._pending_seq += 1
+            entry = (priority, self._pending_seq, path)
+            self._pending[path] = entry
+            heapq.heappush(self._pending_heap, entry)
+
+        self._progress = done, total, start
+        self._ingest_chunk()
+
+    def _unqueue(self, pathes):
+        # the files are dropped before their tags are added.
+        dropped = sum(1 for path in pathes if self._pending.pop(path, None))
+        if dropped and self._progress:
+            done, total, start = self._progress
+            self._progress = done, total - dropped, start
+
+    def _ingest_chunk(self):
+        # files of a higher priority are a chunk of their own, so they are
+        # published without waiting for files queued by earlier works.
+        chunk = []
+        chunk_priority = None
+        while self._pending_heap and len(chunk) < INGEST_CHUNK:
+            entry = self._pending_heap[0]
+            priority, seq, path = entry
+
+            # stale if the file is dropped or requeued by a higher
+            # priority.
+            if self._pending.get(path) is not entry:
+                heapq.heappop(self._pending_heap)
+                continue
+
+            if chunk_priority is None:
+                chunk_priority = priority
+            elif priority != chunk_priority:
+                break
+
+            heapq.heappop(self._pending_heap)
+            del self._pending[path]
+            chunk.append(path)
+
+        self._ctags_table.add(chunk)
+
+        if self._progress:
+            done, total, start = self._progress
+            self._progress = done + len(chunk), total, start
+
+        if self._pending and not self._chunk_scheduled:
+            self._chunk_scheduled = 1
+            self._worker.call(self._run_chunk, PRIORITY_BACKGROUND, 0)
+
+    def _run_chunk(self):
+        self._chunk_scheduled = 0
+        self._ingest_chunk()
+        self._publish()
+
+    def progress(self):
+        """
+        return None if tags of all added files are in the snapshot,
+        otherwise a dict of files done and total since the files began
+        to be added, seconds elapsed, and an estimate of seconds left.
+        """
+
+        progress = self._progress
+        if not progress:
+            return None
+
+        done, total, start = progress
+        elapsed = time.time() - start
+        res = {'done': done, 'total': total, 'elapsed': elapsed, 'eta': None}
+        if done:
+            res['eta'] = elapsed * (total - done) / done
 
-        return obsolete_files
+        return res
 
-    def _add_file(self, path):
-        path = os.path.realpath(path)
-        if not os.access(path, os.R_OK):
-            return
+    def _publish(self):
+        # more files may be added by the works waiting.
+        if not self._pending and not self._worker.pending(0):
+            self._progress = None
 
-        node = self._get_node(path, 1)
-        if node.refcount > 0:
-            node.refcount += 1
-            return
+        names, scopes = self._ctags_table.take_touched()
 
-        # a new node.
-        node.refcount = 1
-        new_deps = node.depends
+        # the snapshot is replaced as a whole, readers in other threads
+        # see either the old one or the new one.  memos which depend on
+        # the changed tags are dropped at the same time.
+        with self._memo_lock:
+            for name in self._memo_names.keys() & names:
+                self._drop_memos(self._memo_names.pop(name))
 
-        node.check_loop = 1
+            for scope in self._memo_scopes.keys() & scopes:
+                self._drop_memos(self._memo_scopes.pop(scope))
 
-        new_files = [path]
-        for f in new_deps:
-            new_files += self._add_file_recursively(f)
+            self._snapshot = self._ctags_table.snapshot()
+
+    def _init_memo(self):
+        self._memo_lock = threading.Lock()
+        self._memo = {}
+
+        # name or scope -> keys of memos which looked it up.
+        self._memo_names = {}
+        self._memo_scopes = {}
+
+    def _drop_memos(self, keys):
+        for key in keys:
+            self._memo.pop(key, None)
+
+    def lookup(self, key, func):
+        """
+        return func(cache), which finds tags by cache.find_tags() and
+        cache.find_members() in the last published snapshot.  the result
+        is memoized by key until tags of the names or scopes it looked up
+        are changed, so func must depend on nothing else.
+        """
+
+        res = self._memo.get(key, _MISSING)
+        if res is not _MISSING:
+            self._stats.count('memo_hits')
+            return res
+
+        self._stats.count('memo_misses')
+
+        snapshot = self._snapshot
+        recorder = LookupRecorder(snapshot)
+        res = func(recorder)
+        if recorder.volatile:
+            return res
+
+        with self._memo_lock:
+            # tags are changed while func is running.
+            if snapshot is not self._snapshot:
+                return res
+
+            if len(self._memo) > 10000:
+                self._memo.clear()
+                self._memo_names.clear()
+                self._memo_scopes.clear()
+
+            self._memo[key] = res
+            for name in recorder.names:
+                self._memo_names.setdefault(name, []).append(key)
+
+            for scope in recorder.scopes:
+                self._memo_scopes.setdefault(scope, []).append(key)
+
+        return res
+
+    def _schedule(self, op, pathes, priority):
+        for path in pathes:
+            self._worker.schedule(op, os.path.realpath(path), priority)
+
+    def add_files(self, pathes, priority = PRIORITY_BACKGROUND):
+        self._schedule('add', pathes, priority)
+
+    def update_files(self, pathes, priority = PRIORITY_INTERACTIVE):
+        self._schedule('update', pathes, priority)
+
+    def remove_files(self, pathes, priority = PRIORITY_BACKGROUND):
+        self._schedule('remove', pathes, priority)
+
+    def generation(self):
+        """
+        the generation of the last published snapshot, it is increased
+        whenever tags are changed.
+        """
+
+        return self._snapshot.generation
+
+    def find_tags(self, name_prefix, match_whole = 0, fresh = 0):
+        """
+        find tags in the last published snapshot, which does not wait
+        for pending works.  if fresh, wait until all pending works are
+        completed, then find tags.
+        """
+
+        if fresh:
+            return self._worker.call(
+                    lambda: self._ctags_table.find(name_prefix, match_whole),
+                    PRIORITY_IDLE)
+
+        with self._stats.timer('find_time'):
+            return self._snapshot.find(name_prefix, match_whole)
+
+    def find_members(self, scope, fresh = 0):
+        if fresh:
+            return self._worker.call(lambda: self._ctags_table.members(scope),
+                                     PRIORITY_IDLE)
+
+        with self._stats.timer('members_time'):
+            return self._snapshot.members(scope)
+
+    def stats(self, reset = 0):
+        """
+        return counters, histograms and sizes of the cache as a dict.  if
+        reset, counters and histograms start from zero again.
+        """
+
+        res = self._stats.as_dict()
+        res['pending_works'] = self._worker.pending()
+        res['file_nodes'] = len(self._file_nodes)
+        res['warm_files'] = len(self._warm_tier)
+        res['warm_tags'] = self._warm_tier.tags
+        res['pending_files'] = len(self._pending)
+        res['tags'] = self._snapshot.tags()
+        res['generation'] = self._snapshot.generation
+        if reset:
+            self._stats.reset()
+
+        return res
+
+    def close(self):
+        """
+        stop the worker and the file watcher without waiting for pending
+        works, which are cancelled.  the last snapshot can still be
+        queried.
+        """
+
+        if self._watcher:
+            self._watcher.close()
 
-        node.check_loop = 0
+        self._worker.close(self._release)
 
-        self._ctags_table.add(new_files)
+    def _release(self):
+        # run by the worker thread when it exits, no work is running.
+        self._pending.clear()
+        self._pending_heap = []
+        self._progress = None
+        self._ctags_table.close()
+
+    def dependents(self, path):
+        """
+        the added files which include path, directly or through other
+        headers.
+        """
 
-    def _update_file(self, path):
         path = os.path.realpath(path)
-        if not os.access(path, os.R_OK):
+        return self._worker.call(
+                lambda: self._include_graph.dependents(path, 1),
+                PRIORITY_IDLE)
+
+    def closure(self, path):
+        """
+        path and all files it includes transitively.
+        """
+
+        path = os.path.realpath(path)
+        return self._worker.call(lambda: self._include_graph.closure([path]),
+                                 PRIORITY_IDLE)
+
+    def _save(self, cache_file):
+        files = {}
+        tags = self._ctags_table.dump()
+        for path, saved in self._saved_nodes.items():
+            if path in tags and os.access(path, os.R_OK):
+                files[path] = saved + (tags[path],)
+
+        # tags of prebuilt files are in the index, and pending files may
+        # have no tags yet, None means they are not saved and the files
+        # are parsed again when they are added after load().
+        prebuilt = self._ctags_table.prebuilt_files()
+        for path, node in self._file_nodes.items():
+            if path in prebuilt:
+                file_tags = None
+            elif path in self._pending:
+                file_tags = tags.get(path)
+            else:
+                file_tags = tags.get(path, [])
+
+            files[path] = (node.fingerprint, node.depends,
+                           node.include_digest, file_tags)
+
+        state = {}
+        state['version'] = CACHE_VERSION
+        state['inc_list'] = self._inc_list
+        state['files'] = files
+
+        os.makedirs(os.path.dirname(cache_file) or '.', exist_ok = True)
+        tmp_file = cache_file + '.tmp'
+        with open(tmp_file, 'wb') as fobj:
+            pickle.dump(state, fobj, pickle.HIGHEST_PROTOCOL)
+
+        os.replace(tmp_file, cache_file)
+
+    def _load(self, cache_file):
+        try:
+            with open(cache_file, 'rb') as fobj:
+                state = pickle.load(fobj)
+        except (OSError, EOFError, pickle.UnpicklingError):
             return
 
-        node = self._get_node(path)
-        if not node:
+        if not isinstance(state, dict) or \
+           state.get('version') != CACHE_VERSION:
             return
 
-        old_depends = node.depends
-        node.renew_depends(self._inc_list)
-        new_deps = node.depends - old_depends
-        obsolete_deps = old_depends - node.depends
+        # depends are resolved by include list, can not reuse them if
+        # include list is changed.
+        same_inc_list = state['inc_list'] == self._inc_list
 
-        node.check_loop = 1
+        tags = {}
+        for path, (fingerprint, depends, include_digest, file_tags) in \
+                state['files'].items():
+            if path in self._file_nodes:
+                continue
 
-        new_files = [path]
-        for f in new_deps:
-            new_files += self._add_file_recursively(f)
+            if not same_inc_list:
+                depends = None
 
-        node.check_loop = 0
+            self._saved_nodes[path] = (fingerprint, depends, include_digest)
+            if file_tags is not None:
+                tags[path] = file_tags
 
-        obsolete_files = [path]
-        for f in obsolete_deps:
-            obsolete_files += self._remove_file_recursively(f)
+        self._ctags_table.load(tags)
 
-        self._ctags_table.delete(obsolete_files)
-        self._ctags_table.add(new_files)
+    def save(self, cache_file):
+        """
+        save tags and file nodes to cache_file.  it waits for the running
+        work and interactive works only, files not ingested yet are saved
+        without tags, so they are parsed again after load().
+        """
 
-    def _remove_file(self, path):
-        path = os.path.realpath(path)
-        obsolete_files = self._remove_file_recursively(path)
-        self._ctags_table.delete(obsolete_files)
-
-    def add_files(self, pathes):
-        def run_func():
-            for path in pathes:
-                self._add_file(path)
-
-        work = {}
-        work["op"] = 'add'
-        work['target'] = pathes
-        work['run'] = run_func
-        
-        self._worker.add_work(work)
-
-    def update_files(self, pathes):
-        def run_func():
-            for path in pathes:
-                self._update_file(path)
-
-        work = {}
-        work["op"] = 'update'
-        work['target'] = pathes
-        work['run'] = run_func
-
-        self._worker.add_work(work)
-
-    def remove_files(self, pathes):
-        def run_func():
-            for path in pathes:
-                self._remove_file(path)
-
-        work = {}
-        work["op"] = 'remove'
-        work['target'] = pathes
-        work['run'] = run_func
-
-        self._worker.add_work(run_func)
-
-    def find_tags(self, name_prefix, match_whole = 0):
-        res = None
-        def run_func():
-            nonlocal res
-            res = self._ctags_table.find(name_prefix, match_whole)
-
-        work = {}
-        work["op"] = 'wait_all_complete'
-        work['target'] = None
-        work['run'] = run_func
-        
-        self._worker.add_work(work)
+        self._worker.call(lambda: self._save(cache_file),
+                          PRIORITY_INTERACTIVE)
 
-        return res
+    def load(self, cache_file):
+        """
+        load the state saved by save().  only files whose content are
+        changed will be parsed again when they are added.
+        """
+
+        self._worker.call(lambda: self._load(cache_file),
+                          PRIORITY_INTERACTIVE, 0)
 
     def printall(self):
         print('file nodes:', len(self._file_nodes),
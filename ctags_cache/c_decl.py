@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+
+"""
+The c_decl module recognizes declarations of local variables and function
+arguments in C source, which ctags does not report.
+
+the source is split into tokens by one pass of a regular expression whose
+alternatives never backtrack, then declarations are recognized from the
+tokens by a loop which visits each token a bounded number of times, so the
+time is linear in the length of source whatever it is.
+"""
+
+import re
+
+# every alternative matches at the current position or fails at once, and
+# unterminated comments and literals run to the end instead of failing.
+TOKEN_RE_OBJ = re.compile(r"""\s+
+                              |//[^\n]*
+                              |/\*.*?(?:\*/|\Z)
+                              |"(?:[^"\\\n]|\\.)*"?
+                              |'(?:[^'\\\n]|\\.)*'?
+                              |\w+
+                              |.""",
+                          re.X|re.S)
+
+C_TYPES = frozenset(['char', 'short', 'int', 'long', 'double', 'float'])
+
+# skipped before the type of a declaration.
+QUALIFIERS = frozenset(['static', 'const', 'volatile', 'register', 'extern',
+                        'auto', 'inline'])
+
+# skipped before the name of a declarator.
+POINTER_QUALIFIERS = frozenset(['*', 'const', 'volatile', 'restrict'])
+
+# statements which start with them are not declarations.
+STATEMENT_KEYWORDS = frozenset(['return', 'goto', 'break', 'continue', 'case',
+                                'default', 'else', 'do', 'if', 'while',
+                                'for', 'switch', 'sizeof', 'typedef'])
+
+OPENINGS = {'(': ')', '[': ']', '{': '}'}
+
+def tokenize(text):
+    """
+    tokens of text without spaces and comments.
+    """
+
+    res = []
+    for m in TOKEN_RE_OBJ.finditer(text):
+        token = m.group(0)
+        if token[0].isspace() or token.startswith(('//', '/*')):
+            continue
+
+        res.append(token)
+
+    return res
+
+def is_identifier(token):
+    return token[0].isalpha() or token[0] == '_'
+
+def _skip_group(tokens, i):
+    """
+    tokens[i] is an opening bracket, return the index after its closing
+    bracket, or len(tokens) + 1 if it is not closed.
+    """
+
+    depth = 0
+    n = len(tokens)
+    while i < n:
+        token = tokens[i]
+        i += 1
+        if token in OPENINGS:
+            depth += 1
+        elif token in ')]}':
+            depth -= 1
+            if depth <= 0:
+                return i
+
+    return n + 1
+
+def _declaration(tokens):
+    """
+    the variables of one declaration without ';', or [] if it is not a
+    declaration.
+    """
+
+    n = len(tokens)
+    i = 0
+    while i < n and tokens[i] in QUALIFIERS:
+        i += 1
+
+    if i < n and tokens[i] in ('struct', 'union', 'enum'):
+        if i + 1 >= n or not is_identifier(tokens[i + 1]):
+            return []
+
+        typeref = tokens[i] + ':' + tokens[i + 1]
+        i += 2
+    else:
+        start = i
+        while i < n and is_identifier(tokens[i]):
+            i += 1
+
+        if i == start or tokens[start] in STATEMENT_KEYWORDS:
+            return []
+
+        # without '*', the last word is the name of first variable.
+        if i == n or tokens[i] != '*':
+            i -= 1
+            if i == start:
+                return []
+
+        typeref = tokens[i - 1]
+        if typeref in C_TYPES:
+            typeref = None
+
+    res = []
+    while 1:
+        while i < n and tokens[i] in POINTER_QUALIFIERS:
+            i += 1
+
+        if i == n or not is_identifier(tokens[i]):
+            return []
+
+        if typeref:
+            res.append({'name': tokens[i], 'typeref': typeref})
+        else:
+            res.append({'name': tokens[i]})
+
+        i += 1
+
+        # is it an array?
+        while i < n and tokens[i] == '[':
+            i = _skip_group(tokens, i)
+
+        # may have initial value.
+        if i < n and tokens[i] == '=':
+            i += 1
+            while i < n and tokens[i] != ',':
+                if tokens[i] in OPENINGS:
+                    i = _skip_group(tokens, i)
+                else:
+                    i += 1
+
+        if i >= n:
+            return res
+
+        # multiply variables definition.
+        if tokens[i] != ',':
+            return []
+
+        i += 1
+
+def _statements(tokens):
+    """
+    yield tokens of every statement which is ended by ';'.  statements
+    ended by '{' or '}' are dropped, except the initialization of a "for"
+    loop.
+    """
+
+    n = len(tokens)
+    start = 0
+    depth = 0
+    assigned = 0
+    i = 0
+    while i < n:
+        token = tokens[i]
+        if token == 'for' and depth == 0 and i + 1 < n and \
+           tokens[i + 1] == '(':
+            end = i + 2
+            while end < n and tokens[end] != ';' and tokens[end] != ')':
+                end += 1
+
+            if end < n and tokens[end] == ';':
+                yield tokens[i + 2:end]
+
+            i = _skip_group(tokens, i + 1)
+            start = i
+            continue
+
+        if token in '([' or (token == '{' and assigned):
+            depth += 1
+        elif token in ')]' or (token == '}' and depth):
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            if token == '=':
+                assigned = 1
+            elif token == ';':
+                yield tokens[start:i]
+                start = i + 1
+                assigned = 0
+            elif token in '{}':
+                start = i + 1
+                assigned = 0
+
+        i += 1
+
+def local_declarations(text):
+    """
+    the local variables declared in text as {'name', 'typeref'} records,
+    'typeref' is absent for builtin types.
+    """
+
+    res = []
+    for statement in _statements(tokenize(text)):
+        res += _declaration(statement)
+
+    return res
+
+def function_arguments(text):
+    """
+    the arguments of the function whose header is text, or None if text
+    has no complete function header.
+    """
+
+    tokens = tokenize(text)
+    n = len(tokens)
+    i = 0
+    while i < n:
+        if tokens[i] != '(':
+            i += 1
+            continue
+
+        # a function header is "type name (".
+        if i < 2 or not is_identifier(tokens[i - 1]) or \
+           tokens[i - 1] in STATEMENT_KEYWORDS or \
+           not (is_identifier(tokens[i - 2]) or tokens[i - 2] == '*'):
+            i = _skip_group(tokens, i)
+            continue
+
+        end = _skip_group(tokens, i)
+        if end > n:
+            return None
+
+        res = []
+        arg_start = i + 1
+        j = i + 1
+        while j < end:
+            if j == end - 1 or tokens[j] == ',':
+                res += _declaration(tokens[arg_start:j])[:1]
+                arg_start = j + 1
+                j += 1
+            elif tokens[j] in OPENINGS:
+                j = _skip_group(tokens, j)
+            else:
+                j += 1
+
+        return res
+
+    return None
+
+if __name__ == "__main__":
+    # compare with the former regular expressions on inputs which make
+    # them backtrack, run it by "python -m ctags_cache.c_decl".
+    import timeit
+
+    VARIABLE_RE_OBJ = re.compile(r"""(?:static\s+)?
+                                     (?:const\s+)?
+                                     (?:(?:(struct|union|enum)\s+)|
+                                        (?:\w+\s+)*)?
+                                     (\w+)
+                                     ([\s\*]+(?:const\s+)?\w+\s*
+                                      (?:\[.*\]\s*)*
+                                      (?:=[^;]*)?
+                                      (?:,
+                                         [\s\*]*(?:const\s+)?\w+\s*
+                                         (?:\[.*\]\s*)*
+                                         (?:=[^;]*)?)*)
+                                     ;""",
+                                 re.X|re.S)
+
+    def former(text):
+        return list(VARIABLE_RE_OBJ.finditer(text))
+
+    # (name, input of size n, sizes, the largest size to run the former).
+    cases = [
+        # a long macro invocation without ';'.
+        ('words', lambda n: 'MACRO ' * n, (50, 100, 200, 400), 200),
+        # arrays without ';', it grows exponentially.
+        ('brackets', lambda n: 'int a' + '[1]' * n, (8, 12, 16, 400), 16),
+        # many initializers without ';'.
+        ('initializers', lambda n: 'int a = 1, ' * n, (50, 100, 200, 400),
+         400),
+    ]
+
+    for name, make, sizes, former_limit in cases:
+        for n in sizes:
+            text = make(n)
+            t_former = float('nan')
+            if n <= former_limit:
+                t_former = min(timeit.repeat(lambda: former(text),
+                                             number = 1, repeat = 3))
+
+            t_new = min(timeit.repeat(lambda: local_declarations(text),
+                                      number = 1, repeat = 3))
+            print('%-13s n=%-6d former %10.6fs  tokenizer %10.6fs' %
+                  (name, n, t_former, t_new))
+
+    # a large input, the time should grow linearly.
+    for n in (10000, 20000, 40000):
+        text = 'MACRO(a, b) x ' * n + 'int y[' * n
+        t_new = min(timeit.repeat(lambda: local_declarations(text),
+                                  number = 1, repeat = 3))
+        print('%-13s n=%-6d tokenizer %10.6fs' % ('mixed', n, t_new))
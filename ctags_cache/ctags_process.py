@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+The ctags_process module keeps universal-ctags processes running in
+interactive mode, so parsing a file does not pay for starting a shell and
+ctags every time.
+"""
+
+import json
+import subprocess
+
+from .tag import Tag
+
+CTAGS_INTERACTIVE_CMD = ['ctags', '--_interactive', '--fields=fksSztn',
+                         '--extras=+q', '--kinds-C=+p', '-u']
+
+# long kind names of C which ctags may print in JSON.
+KIND_LETTERS = {
+    'class': 'c',
+    'macro': 'd',
+    'enumerator': 'e',
+    'function': 'f',
+    'enum': 'g',
+    'header': 'h',
+    'local': 'l',
+    'member': 'm',
+    'prototype': 'p',
+    'struct': 's',
+    'typedef': 't',
+    'union': 'u',
+    'variable': 'v',
+    'externvar': 'x',
+    'label': 'L',
+}
+
+_interactive_supported = None
+
+def interactive_supported():
+    """
+    whether the ctags in PATH is universal-ctags with interactive mode.
+    """
+
+    global _interactive_supported
+    if _interactive_supported is None:
+        try:
+            out = subprocess.run(['ctags', '--list-features'],
+                                 stdin = subprocess.DEVNULL,
+                                 stdout = subprocess.PIPE,
+                                 stderr = subprocess.DEVNULL).stdout
+            _interactive_supported = b'interactive' in out
+        except OSError:
+            _interactive_supported = False
+
+    return _interactive_supported
+
+def json_to_tag(obj):
+    tag = Tag(obj['name'], obj['path'], str(obj.get('line', '')))
+
+    kind = obj.get('kind')
+    if kind:
+        tag.set_field('kind', KIND_LETTERS.get(kind, kind))
+
+    if 'scope' in obj and 'scopeKind' in obj:
+        tag.set_field(obj['scopeKind'], obj['scope'])
+
+    for field in ('typeref', 'signature'):
+        if field in obj:
+            tag.set_field(field, obj[field])
+
+    if obj.get('file'):
+        tag.set_field('file', '')
+
+    return tag
+
+class CtagsProcess:
+    """
+    one ctags process in interactive mode, it is restarted if it exits.
+    """
+
+    def __init__(self):
+        self._proc = None
+
+    def _start(self):
+        self._proc = subprocess.Popen(CTAGS_INTERACTIVE_CMD,
+                                      stdin = subprocess.PIPE,
+                                      stdout = subprocess.PIPE,
+                                      stderr = subprocess.DEVNULL)
+
+        # ctags greets with its program info first.
+        self._proc.stdout.readline()
+
+    def _generate_tags(self, path):
+        request = {'command': 'generate-tags', 'filename': path}
+        self._proc.stdin.write(json.dumps(request).encode('utf-8') + b'\n')
+        self._proc.stdin.flush()
+
+        tags = []
+        while 1:
+            line = self._proc.stdout.readline()
+            if not line:
+                raise BrokenPipeError("ctags exited")
+
+            obj = json.loads(line.decode('utf-8'))
+            if obj.get('_type') == 'tag':
+                tags.append(json_to_tag(obj))
+            elif obj.get('_type') == 'completed':
+                return tags
+
+    def generate_tags(self, path):
+        """
+        return tags of file.  if ctags crashed, start it again and retry
+        once, then give up the file.
+        """
+
+        for retry in range(2):
+            try:
+                if not self._proc or self._proc.poll() is not None:
+                    self._start()
+
+                return self._generate_tags(path)
+
+            except (OSError, ValueError):
+                self.close()
+
+        return []
+
+    def run(self, file_list):
+        tags = []
+        for path in file_list:
+            tags += self.generate_tags(path)
+
+        return tags
+
+    def close(self):
+        if self._proc:
+            self._proc.kill()
+            self._proc.wait()
+            self._proc = None
+
+class CtagsPool:
+    """
+    a pool of ctags processes, one for each shard which is parsed in
+    parallel.
+    """
+
+    def __init__(self, size):
+        self._procs = [CtagsProcess() for i in range(size)]
+
+    def run(self, n, file_list):
+        return self._procs[n % len(self._procs)].run(file_list)
+
+    def close(self):
+        for proc in self._procs:
+            proc.close()
@@ -1,31 +1,93 @@
 #!/usr/bin/env python
 
+import os
+import sys
+import heapq
+import threading
 import subprocess
 
-from .utils import binary_search
+from .tag import Tag, SCOPE_KINDS
+from .ctags_process import CtagsPool, interactive_supported
+from .utils import SortedChunkList, prefix_upper_bound
+from .utils import typeref_to_struct_name
+from .stats import Stats
 
 CTAGS_CMD = 'ctags --fields=fksSzt --extra=+q --c-kinds=+p -n -u -L - -f -'
 
+# kinds of scope which have members.
+STRUCT_KINDS = frozenset(['struct', 'union', 'class'])
+
+# a shard smaller than this is not worth a ctags process of its own.
+MIN_SHARD_SIZE = 256 * 1024
+
+def default_jobs():
+    return os.cpu_count() or 1
+
+def split_into_shards(file_list, jobs):
+    """
+    split file_list into at most 'jobs' shards which have nearly the same
+    total file size.
+
+    the biggest files are placed first, each one goes to the lightest
+    shard so far.  the order of files in a shard is kept.
+    """
+
+    sizes = []
+    total = 0
+    for i, path in enumerate(file_list):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+
+        sizes.append((size, i, path))
+        total += size
+
+    jobs = min(jobs, len(file_list), total // MIN_SHARD_SIZE + 1)
+    if jobs <= 1:
+        return [list(file_list)] if file_list else []
+
+    shards = [(0, n, []) for n in range(jobs)]
+    for size, i, path in sorted(sizes, reverse = True):
+        load, n, shard = heapq.heappop(shards)
+        shard.append((i, path))
+        heapq.heappush(shards, (load + size, n, shard))
+
+    return [[path for i, path in sorted(shard)] for load, n, shard in shards]
+
+def run_ctags(file_list, stats = None):
+    """
+    run a new ctags process over file_list and return the tags.
+    """
+
+    stats = stats or Stats()
+    with stats.timer('ctags_time'):
+        p = subprocess.Popen(CTAGS_CMD, shell = True, stdin = subprocess.PIPE,
+                stdout = subprocess.PIPE)
+        out, err = p.communicate('\n'.join(file_list).encode('utf-8'))
+
+    stats.count('ctags_output_bytes', len(out))
+    with stats.timer('parse_time'):
+        return parse_ctags_output(out)
+
 def parse_ctags_line(line):
     """
     parse tags file's line then return result.
 
-    the result is a dict which has many fields: name, path, address, kind,
+    the result is a Tag which has many fields: name, path, address, kind,
     scope, signature, typeref, etc.
     """
 
-    res = {}
-
     idx = line.find('\t')
-    res['name'] = line[:idx]
+    name = line[:idx]
     
     start = idx + 1
     idx = line.find('\t', start)
-    res['path'] = line[start:idx]
+    path = line[start:idx]
 
     start = idx + 1
     idx = line.find(';"\t', start)
-    res['address'] = line[start:idx]
+    res = Tag(name, path, line[start:idx])
 
     start = idx + 3
 
@@ -46,118 +108,505 @@ def parse_ctags_line(line):
         value = line[start:idx]
         start = idx + 1
 
-        res[field] = value
+        res.set_field(field, value)
 
         if start == len(line):
             break
     
     return res
 
-def make_search_matcher(field, target, match):
-    def matcher(key):
-        if match(key[field], target):
-            return '='
-        elif key[field] > target:
-            return '>'
-        elif key[field] < target:
-            return '<'
+def parse_ctags_output(data):
+    """
+    parse the whole ctags output in bytes, return list of Tag.
+
+    the output is decoded once and split by str.split(), and the fields
+    are stored into Tag slots directly.  repeated strings are interned
+    through a local dict, which is cheaper than sys.intern() per field.
+    """
 
-    return matcher
+    tags = []
+    strings = {}
+    get = strings.get
+    intern = lambda s: strings.setdefault(s, sys.intern(s))
+
+    new_tag = Tag.__new__
+    for line in data.decode('utf-8', 'replace').split('\n'):
+        if not line:
+            continue
+
+        fields = line.split('\t')
+        if len(fields) < 3 or not fields[2].endswith(';"'):
+            # the address is a pattern which may contain tabs.
+            tags.append(parse_ctags_line(line + '\n'))
+            continue
+
+        tag = new_tag(Tag)
+        tag.name = fields[0]
+        tag.path = get(fields[1]) or intern(fields[1])
+        address = fields[2][:-2]
+        tag.address = int(address) if address.isdigit() else address
+        tag.kind = tag.scope_kind = tag.scope = tag.signature = None
+        tag.typeref = tag.file = tag.extra = None
+
+        for field in fields[3:]:
+            key, sep, value = field.partition(':')
+            if key == 'kind':
+                tag.kind = get(value) or intern(value)
+            elif key == 'typeref':
+                tag.typeref = get(value) or intern(value)
+            elif key in SCOPE_KINDS:
+                tag.scope_kind = get(key) or intern(key)
+                tag.scope = get(value) or intern(value)
+            else:
+                tag.set_field(key, value)
+
+        tags.append(tag)
+
+    return tags
+
+class CtagsTableView:
+    """
+    a read-only view of tags which answers queries.  CtagsTable.snapshot()
+    returns views which are never modified, so they can be queried while
+    the table is being changed by another thread.
+    """
 
-class CtagsTable:
+    def __init__(self, tag_list, scope_dict, child_scopes, anon_typerefs,
+                 generation, prebuilt = ()):
+        self._tag_list = tag_list
 
-    def __init__(self):
-        self._tag_list = []
-        self._file_dict = {}
+        # the member index: scope name -> its member tags (as an ordered
+        # set), parent scope name -> child scope names, and how many tags
+        # refer to each anonymous struct by typeref.
+        self._scope_dict = scope_dict
+        self._child_scopes = child_scopes
+        self._anon_typerefs = anon_typerefs
+
+        # increased whenever tags are changed.
+        self.generation = generation
+
+        # (PrebuiltIndex, ids of its files which are added) pairs.
+        self._prebuilt = prebuilt
 
     def tags(self):
-        return len(self._tag_list)
+        return len(self._tag_list) + sum(index.file_tags(fid)
+                                         for index, live in self._prebuilt
+                                         for fid in live)
+
+    def find(self, name_prefix, match_whole):
+        if match_whole:
+            res = self._tag_list.irange(name_prefix, name_prefix, 1)
+        else:
+            res = self._tag_list.irange(name_prefix,
+                                        prefix_upper_bound(name_prefix))
+
+        for index, live in self._prebuilt:
+            if not live:
+                continue
+
+            more = index.find(name_prefix, match_whole, live)
+            if res and more:
+                res = list(heapq.merge(res, more, key = lambda x: x.name))
+            elif more:
+                res = more
+
+        return res
+
+    def _direct_members(self, scope):
+        # (member tags of scope, child scope -> kind of it).
+        res = list(self._scope_dict.get(scope, ()))
+        children = {}
+        for child in self._child_scopes.get(scope, ()):
+            children[child] = next(iter(self._scope_dict[child])).scope_kind
+
+        for index, live in self._prebuilt:
+            if live:
+                tags, more = index.members(scope, live)
+                res += tags
+                children.update(more)
+
+        return res, children
+
+    def _referred(self, typeref):
+        return typeref in self._anon_typerefs or \
+               any(index.referred(typeref, live)
+                   for index, live in self._prebuilt)
+
+    def members(self, scope):
+        """
+        return member tags of struct, union or class named scope.
+
+        members of an anonymous child struct are members of scope too,
+        unless the anonymous struct is the type of a named member.
+        """
+
+        res, children = self._direct_members(scope)
+        for child, kind in children.items():
+            if not child.rpartition('::')[2].startswith('__anon'):
+                continue
+
+            if self._referred(kind + ':' + child):
+                continue
+
+            res += self.members(child)
+
+        res.sort(key = lambda x: x.name)
+        return res
+
+class CtagsTable(CtagsTableView):
+
+    def __init__(self, jobs = 1, stats = None, prebuilt = ()):
+        """
+        prebuilt is a list of index files built by the prebuilt module,
+        tags of unchanged files in them are found in the mapped files
+        instead of running ctags.
+        """
+
+        # imported here, the prebuilt module imports this module.
+        from .prebuilt import PrebuiltIndex
+
+        CtagsTableView.__init__(self, SortedChunkList(lambda x: x.name),
+                                {}, {}, {}, 0)
+        self._stats = stats or Stats()
+
+        self._indexes = []
+        for path in prebuilt:
+            try:
+                self._indexes.append(PrebuiltIndex(path))
+            except (OSError, ValueError):
+                pass
+
+        # ids of added files of each index, and path -> (index, id).  the
+        # sets are shared with self._prebuilt, so queries of the table see
+        # them as they are changed.
+        self._live = [set() for index in self._indexes]
+        self._prebuilt = tuple(zip(self._indexes, self._live))
+        self._prebuilt_files = {}
+        self._file_dict = {}
+        self._saved_dict = {}
+        self._jobs = jobs or default_jobs()
+
+        # warm ctags processes if ctags supports interactive mode,
+        # otherwise a ctags process is started for each add().
+        self._pool = None
+        if interactive_supported():
+            self._pool = CtagsPool(self._jobs)
+
+        # the last snapshot, and ids of member containers which are not
+        # shared with it.
+        self._snapshot = None
+        self._owned = None
+
+        # names and scopes whose tags are changed since take_touched().
+        self._touched_names = set()
+        self._touched_scopes = set()
 
     def files(self):
-        return len(self._file_dict)
+        return len(self._file_dict) + len(self._prebuilt_files)
+
+    def close(self):
+        """
+        stop the ctags processes, the table must not be changed any more.
+        """
+
+        if self._pool:
+            self._pool.close()
+
+    def prebuilt_files(self):
+        """
+        the added files whose tags are in prebuilt indexes.
+        """
+
+        return set(self._prebuilt_files)
+
+    def snapshot(self):
+        if not self._snapshot or self._snapshot.generation != self.generation:
+            self._snapshot = CtagsTableView(self._tag_list.snapshot(),
+                                            dict(self._scope_dict),
+                                            dict(self._child_scopes),
+                                            dict(self._anon_typerefs),
+                                            self.generation,
+                                            self._prebuilt_snapshot())
+            self._owned = set()
+
+        return self._snapshot
+
+    def _prebuilt_snapshot(self):
+        return tuple((index, frozenset(live))
+                     for index, live in zip(self._indexes, self._live))
+
+    def take_touched(self):
+        """
+        return (names, scopes) of tags added or deleted since last call.
+        a scope is touched if any of its nested scopes is touched.
+        """
+
+        res = self._touched_names, self._touched_scopes
+        self._touched_names = set()
+        self._touched_scopes = set()
+        return res
+
+    def _touch_scope(self, scope):
+        while scope and scope not in self._touched_scopes:
+            self._touched_scopes.add(scope)
+            scope = scope.rpartition('::')[0]
+
+    def _writable(self, index, key, new_value):
+        """
+        return index[key] which can be modified, copy it first if it is
+        shared with the snapshot.
+        """
+
+        value = index.get(key)
+        if value is None:
+            value = index[key] = new_value
+        elif self._owned is None or id(value) in self._owned:
+            return value
+        else:
+            value = index[key] = value.copy()
 
-    def delete(self, file_list):
-        deleted_tags = 0
+        if self._owned is not None:
+            self._owned.add(id(value))
+
+        return value
+
+    def _index_members(self, tags):
+        for tag in tags:
+            if tag.scope:
+                self._touch_scope(tag.scope)
+
+            if tag.typeref and '__anon' in tag.typeref:
+                typeref = typeref_to_struct_name(tag.typeref)
+                self._anon_typerefs[typeref] = \
+                    self._anon_typerefs.get(typeref, 0) + 1
+                self._touch_scope(typeref.partition(':')[2])
+
+            # only qualified tags, e.g. "foo::bar", are indexed, the
+            # unqualified one is a duplicate.
+            scope = tag.scope
+            if tag.scope_kind not in STRUCT_KINDS or \
+               not tag.name.startswith(scope + '::'):
+                continue
+
+            if scope not in self._scope_dict:
+                parent = scope.rpartition('::')[0]
+                if parent:
+                    self._writable(self._child_scopes, parent,
+                                   set()).add(scope)
+
+            self._writable(self._scope_dict, scope, {})[tag] = None
+
+    def _unindex_members(self, tags):
+        for tag in tags:
+            if tag.scope:
+                self._touch_scope(tag.scope)
+
+            if tag.typeref and '__anon' in tag.typeref:
+                typeref = typeref_to_struct_name(tag.typeref)
+                self._touch_scope(typeref.partition(':')[2])
+                self._anon_typerefs[typeref] -= 1
+                if not self._anon_typerefs[typeref]:
+                    del self._anon_typerefs[typeref]
+
+            members = self._scope_dict.get(tag.scope)
+            if members is None or tag not in members:
+                continue
+
+            members = self._writable(self._scope_dict, tag.scope, None)
+            del members[tag]
+            if members:
+                continue
+
+            del self._scope_dict[tag.scope]
+            parent = tag.scope.rpartition('::')[0]
+            if parent:
+                children = self._writable(self._child_scopes, parent, None)
+                children.discard(tag.scope)
+                if not children:
+                    del self._child_scopes[parent]
+
+    def delete(self, file_list, keep = 0):
+        """
+        remove tags of the files from the table, returns path -> number of
+        tags removed from memory, which does not count tags of prebuilt
+        indexes.  if keep, the tags are kept like the loaded ones, and
+        used again if the files are added before forget().
+        """
+
+        res = {}
         for path in file_list:
+            if path in self._prebuilt_files:
+                self._remove_prebuilt(path)
+                continue
+
             if path not in self._file_dict:
                 continue
 
-            for tag in self._file_dict[path]:
-                tag['name'] = '\255'
-                deleted_tags += 1
+            tags = self._file_dict.pop(path)
+            res[path] = len(tags)
+            if keep:
+                self._saved_dict[path] = tags
 
-            del self._file_dict[path]
+            self.generation += 1
+            self._stats.count('tags_deleted', len(tags))
+            with self._stats.timer('index_time'):
+                self._touched_names.update(tag.name for tag in tags)
+                self._unindex_members(tags)
+                for tag in tags:
+                    self._tag_list.remove(tag)
 
-        if deleted_tags:
-            self._tag_list.sort(key = lambda x: x['name'])
-            self._tag_list[-deleted_tags:] = []
+        return res
 
-    def add(self, file_list):
-        p = subprocess.Popen(CTAGS_CMD, shell = True, stdin = subprocess.PIPE, 
-                stdout = subprocess.PIPE)
-        p.stdin.write('\n'.join(file_list).encode('utf-8'))
-        p.stdin.close()
+    def _run_shard(self, n, shard):
+        if self._pool:
+            # the output is parsed while ctags is running.
+            with self._stats.timer('ctags_time'):
+                return self._pool.run(n, shard)
 
-        path = ''
-        tags = None
-        for line in p.stdout:
-            ret = parse_ctags_line(line.decode('utf-8'))
-            self._tag_list.append(ret)
+        return run_ctags(shard, self._stats)
 
-            if not path or path != ret['path']:
-                path = ret['path']
-                tags = []
-                self._file_dict[path] = tags
+    def _run_shards(self, shards):
+        if len(shards) <= 1:
+            return [self._run_shard(n, shard)
+                    for n, shard in enumerate(shards)]
 
-            tags.append(ret)
+        outputs = [None] * len(shards)
+        def run_shard(n):
+            outputs[n] = self._run_shard(n, shards[n])
 
-        p.stdout.close()
+        threads = [threading.Thread(target = run_shard, args = (n,))
+                   for n in range(len(shards))]
+        for t in threads:
+            t.start()
 
-        self._tag_list.sort(key = lambda x: x['name'])
+        for t in threads:
+            t.join()
 
-    def find(self, name_prefix, match_whole):
-        if not match_whole:
-            matcher = make_search_matcher('name', name_prefix,
-                    lambda x, y: x.startswith(y))
-        else:
-            matcher = make_search_matcher('name', name_prefix,
-                    lambda x, y: x == y)
+        return outputs
+
+    def dump(self):
+        """
+        return tags of every file, including the saved ones which are not
+        added yet.
+        """
 
-        idx = binary_search(self._tag_list, matcher)
-        if idx == None:
-            return []
+        res = dict(self._saved_dict)
+        res.update(self._file_dict)
+        return res
 
-        res = []
-        for tag in self._tag_list[idx:]:
-            if matcher(tag) != '=':
-                break
+    def load(self, file_dict):
+        """
+        keep tags dumped by a previous session, they are used instead of
+        running ctags when the files are added.
+        """
 
-            res.append(tag)
+        self._saved_dict.update(file_dict)
 
-        return res
+    def forget(self, path):
+        self._saved_dict.pop(path, None)
+
+    def _touch_prebuilt(self, index, fid):
+        self.generation += 1
+        names = index.file_names(fid)
+        self._touched_names.update(names)
+        for name in names:
+            self._touch_scope(name.rpartition('::')[0])
+
+        for typeref in index.file_anon_typerefs(fid):
+            self._touch_scope(typeref.partition(':')[2])
+
+    def _add_prebuilt(self, path):
+        for n, index in enumerate(self._indexes):
+            fid = index.covers(path)
+            if fid is not None:
+                self._live[n].add(fid)
+                self._prebuilt_files[path] = (n, fid)
+                self._touch_prebuilt(index, fid)
+                return 1
+
+        return 0
+
+    def _remove_prebuilt(self, path):
+        n, fid = self._prebuilt_files.pop(path)
+        self._live[n].discard(fid)
+        self._touch_prebuilt(self._indexes[n], fid)
+
+    def add(self, file_list):
+        new_tags = []
+        parse_list = []
+        prebuilt = 0
+        for path in file_list:
+            if self._indexes and self._add_prebuilt(path):
+                self._saved_dict.pop(path, None)
+                prebuilt += 1
+                continue
+
+            if path not in self._saved_dict:
+                parse_list.append(path)
+                continue
+
+            tags = self._saved_dict.pop(path)
+            new_tags += tags
+            self._file_dict[path] = tags
+
+        shards = split_into_shards(parse_list, self._jobs)
+        self._stats.count('files_parsed', len(parse_list))
+        self._stats.count('files_prebuilt', prebuilt)
+        self._stats.count('files_reused',
+                          len(file_list) - len(parse_list) - prebuilt)
+
+        for output in self._run_shards(shards):
+            path = ''
+            tags = None
+            for ret in output:
+                new_tags.append(ret)
+
+                if not path or path != ret.path:
+                    path = ret.path
+                    tags = self._file_dict.setdefault(path, [])
+
+                tags.append(ret)
+
+        for path in file_list:
+            if path not in self._prebuilt_files:
+                self._stats.observe('tags_per_file',
+                                    len(self._file_dict.get(path, ())))
+
+        self._stats.count('tags_added', len(new_tags))
+        if new_tags:
+            self.generation += 1
+            self._touched_names.update(tag.name for tag in new_tags)
+
+        with self._stats.timer('index_time'):
+            self._tag_list.update(new_tags)
+            self._index_members(new_tags)
 
     def printall(self):
-        for tag in self._tag_list:
+        for tag in self.find('', 0):
             print(tag)
 
 if __name__ == "__main__":
-    cb_header = """
-import subprocess
-import ctags_table
-cmd = "find ../test -name '*.[ch]'"
-p = subprocess.Popen(cmd, shell = True, stdin = subprocess.PIPE,
-        stdout = subprocess.PIPE)
-li = [ line.decode('utf-8').strip() for line in p.stdout ]
-tbl = ctags_table.CtagsTable()
-tbl.add(li)
-print('tags:', tbl.tags(), 'files:', tbl.files())
-    """
+    # compare the bulk parser with the per-line parser, run it by
+    # "python -m ctags_cache.ctags_table".
+    import timeit
 
-    cb_body = "tbl.delete(li[0:1]); print(tbl.tags())"
-    cb_body = "tbl.add(li[0:1]); print(tbl.tags())"
-    cb_body = "print(tbl.find('simple_init'))"
+    lines = []
+    for i in range(500000):
+        lines.append('member_%d\t/usr/include/linux/header_%d.h\t%d;"\t'
+                     'kind:m\tstruct:struct_%d\ttyperef:struct:type_%d\n' %
+                     (i, i // 500, i % 5000, i // 20, i % 100))
 
-    import timeit
+    data = ''.join(lines).encode('utf-8')
+
+    def per_line():
+        return [parse_ctags_line(line.decode('utf-8'))
+                for line in data.splitlines(True)]
+
+    def bulk():
+        return parse_ctags_output(data)
 
-    print(timeit.Timer(cb_body, cb_header).timeit(1))
+    assert [t.items() for t in per_line()[:100]] == \
+           [t.items() for t in bulk()[:100]]
 
+    for func in (per_line, bulk):
+        print(func.__name__, min(timeit.Timer(func).repeat(3, 1)))
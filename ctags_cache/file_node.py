@@ -1,67 +1,251 @@
 #!/usr/bin/env python
 
 import os
+import hashlib
+
+def file_fingerprint(path, old = None):
+    """
+    return (mtime, size, digest) of the file.
+
+    if 'old' is given and the mtime and size of the file are not changed,
+    'old' is returned without reading the file.
+    """
+
+    st = os.stat(path)
+    if old and old[0] == st.st_mtime_ns and old[1] == st.st_size:
+        return old
+
+    with open(path, 'rb') as fobj:
+        digest = hashlib.sha1(fobj.read()).hexdigest()
+
+    return (st.st_mtime_ns, st.st_size, digest)
+
+class IncludeResolver:
+    """
+    resolve header names to paths for all file nodes which use the same
+    include list.
+
+    results are cached by (search directories, header name), and the
+    existence of headers is checked against cached directory listings
+    instead of calling os.access() for every directory.  call refresh()
+    before a batch of work, then each directory is stat()ed at most once
+    in the batch, and the cache is dropped if any directory is modified.
+    """
+
+    def __init__(self, inclist = []):
+        self.inclist = tuple(inclist)
+        self._search_dirs = {}
+        self._results = {}
+        self._listings = {}
+        self._checked = set()
+        self._generation = 0
+
+    def refresh(self):
+        self._checked.clear()
+
+    def search_dirs(self, path_prefix, quoted):
+        """
+        the directories searched for '#include "..."' (quoted) or
+        '#include <...>' in a file which is in path_prefix.
+        """
+
+        key = (path_prefix, quoted)
+        dirs = self._search_dirs.get(key)
+        if dirs is None:
+            dirs = tuple(d for d in self.inclist if d != path_prefix)
+            if quoted:
+                dirs = (path_prefix,) + dirs
+            else:
+                dirs = dirs + (path_prefix,)
+
+            self._search_dirs[key] = dirs
+
+        return dirs
+
+    def _listing(self, dirname):
+        listing = self._listings.get(dirname)
+        if dirname in self._checked:
+            return listing[1]
+
+        self._checked.add(dirname)
+        try:
+            mtime = os.stat(dirname).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        if listing and listing[0] == mtime:
+            return listing[1]
+
+        names = frozenset()
+        if mtime is not None:
+            try:
+                names = frozenset(os.listdir(dirname))
+            except OSError:
+                pass
+
+        if listing:
+            # headers may be added or removed.
+            self._generation += 1
+
+        self._listings[dirname] = (mtime, names)
+        return names
+
+    def _exists(self, path):
+        dirname, basename = os.path.split(path)
+        return basename in self._listing(dirname)
+
+    def resolve(self, dirs, name):
+        """
+        return path of header 'name' in the first directory of dirs which
+        has it, or None.
+        """
+
+        res = self._results.get((dirs, name))
+        if res:
+            path, searched, generation = res
+            # the stat()s done here may find modified directories.
+            for candidate in searched:
+                self._exists(candidate)
+
+            if generation == self._generation:
+                return path
+
+        path = None
+        searched = []
+        for incpath in dirs:
+            candidate = os.path.join(incpath, name)
+            searched.append(candidate)
+
+            # the listing has dangling symlinks and unreadable files too,
+            # the header is searched in the next dir then.
+            if self._exists(candidate) and os.access(candidate, os.R_OK):
+                path = candidate
+                break
+
+        self._results[(dirs, name)] = (path, searched, self._generation)
+        return path
 
 class CFileNode:
 
-    def __init__(self, path, inclist = []):
+    def __init__(self, path, resolver = None, saved = None):
+        """
+        'saved' is the (fingerprint, depends, include_digest) of this file
+        stored by a previous session, the depends are reused if the file
+        content is not changed.
+        """
+
         self.path = path
-        self.refcount = 0
-        self.check_loop = 0
         self.depends = None
-        
-        self.renew_depends(inclist)
+        self.fingerprint = None
+        self.include_digest = None
+
+        if saved and saved[1] is not None:
+            fingerprint = file_fingerprint(path, saved[0])
+            if fingerprint[2] == saved[0][2]:
+                self.fingerprint = fingerprint
+                self.depends = saved[1]
+                self.include_digest = saved[2]
+                return
+
+        self.renew_depends(resolver)
 
     def __str__(self):
         return self.path
 
-    def _header_files(self, inclist):
+    def _include_names(self, lines):
+        """
+        yield (endchar, name) of every "#include" line.
+        """
+
+        for line in lines:
+            line = line.lstrip()
+            if not line.startswith("#"):
+                continue
+
+            # skip "#" and space.
+            line = line[1:].lstrip()
+            if not line.startswith('include'):
+                continue
+
+            # skip "include" and space.
+            line = line[7:].lstrip()
+            if not line:
+                continue
+
+            if line[0] == '"':
+                endchar = '"'
+            elif line[0] == '<':
+                endchar = '>'
+            else:
+                continue
+
+            end = line.find(endchar, 1)
+            if end < 0:
+                continue
+
+            # strip '"', '<>', and space.
+            line = line[1:end].strip()
+            if not line:
+                continue
+
+            yield endchar, line
+
+    def _header_files(self, names, resolver):
+        if not resolver:
+            resolver = IncludeResolver()
+
         path_prefix = os.path.dirname(self.path)
-        with open(self.path, 'r', buffering = 131072, encoding = "ascii", errors='ignore') as fobj:
-            for line in fobj:
-                line = line.lstrip()
-                if not line.startswith("#"):
-                    continue
-
-                # skip "#" and space.
-                line = line[1:].lstrip()
-                if not line.startswith('include'):
-                    continue
-
-                # skip "include" and space.
-                line = line[7:].lstrip()
-                if not line:
-                    continue
-
-                if path_prefix in inclist:
-                    inclist.remove(path_prefix)
-
-                if line[0] == '"':
-                    endchar = '"'
-                    inclist.insert(0, path_prefix)
-                elif line[0] == '<':
-                    endchar = '>'
-                    inclist.append(path_prefix)
-                else:
-                    continue
-
-                end = line.find(endchar, 1)
-                if end < 0:
-                    continue
-
-                # strip '"', '<>', and space.
-                line = line[1:end].strip()
-                if not line:
-                    continue
-
-                for incpath in inclist:
-                    path = os.path.join(incpath, line)
-                    if os.access(path, os.R_OK):
-                        yield path
-                        break
-
-    def renew_depends(self, inclist = []):
-        self.depends = frozenset(self._header_files(inclist))
+        for endchar, name in names:
+            dirs = resolver.search_dirs(path_prefix, endchar == '"')
+            path = resolver.resolve(dirs, name)
+            if path:
+                yield path
+
+    def _read(self):
+        st = os.stat(self.path)
+        with open(self.path, 'rb') as fobj:
+            data = fobj.read()
+
+        fingerprint = (st.st_mtime_ns, st.st_size,
+                       hashlib.sha1(data).hexdigest())
+
+        return fingerprint, data
+
+    def _renew_depends(self, data, resolver):
+        lines = data.decode('ascii', 'ignore').splitlines()
+        names = list(self._include_names(lines))
+        include_digest = hashlib.sha1(repr(names).encode('utf-8')).hexdigest()
+        if include_digest == self.include_digest:
+            return 0
+
+        self.include_digest = include_digest
+        self.depends = frozenset(self._header_files(names, resolver))
+        return 1
+
+    def renew_depends(self, resolver = None):
+        self.fingerprint, data = self._read()
+        self.include_digest = None
+        self._renew_depends(data, resolver)
+
+    def renew(self, resolver = None):
+        """
+        check whether the file is changed since last renew.
+
+        returns (content_changed, includes_changed).  the depends are
+        only resolved again if the "#include" lines are changed.
+        """
+
+        st = os.stat(self.path)
+        if (st.st_mtime_ns, st.st_size) == self.fingerprint[:2]:
+            return 0, 0
+
+        fingerprint, data = self._read()
+        content_changed = fingerprint[2] != self.fingerprint[2]
+        self.fingerprint = fingerprint
+        if not content_changed:
+            return 0, 0
+
+        return 1, self._renew_depends(data, resolver)
 
 def get_file_class(file_type):
     if file_type == 'c':
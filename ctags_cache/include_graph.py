@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+"""
+The include_graph module keeps which files include which, in both
+directions, for the files added to a CtagsCache.
+"""
+
+from collections import deque
+
+class IncludeGraph:
+    """
+    the files explicitly added are roots, a file is live while it is
+    reachable from a root through "#include" edges.
+
+    all traversals use an explicit stack or queue, so deep include chains
+    do not overflow the python stack, and cycles are visited only once.
+    adding edges visits only the files which become live, removing edges
+    visits the files which become unreachable and the files they include
+    directly, and searches the includers of files still included for a
+    root.
+    """
+
+    def __init__(self):
+        # path -> number of times it is added explicitly.
+        self._roots = {}
+
+        # live path -> frozenset of included paths.
+        self._depends = {}
+
+        # path -> set of live paths which include it.
+        self._dependents = {}
+
+    def __contains__(self, path):
+        return path in self._depends
+
+    def __len__(self):
+        return len(self._depends)
+
+    def depends(self, path):
+        return self._depends.get(path, frozenset())
+
+    def dependents(self, path, transitive = 0):
+        """
+        the live files which include path, directly or, if transitive,
+        through other headers.
+        """
+
+        if not transitive:
+            return set(self._dependents.get(path, ()))
+
+        res = set()
+        stack = [path]
+        while stack:
+            for p in self._dependents.get(stack.pop(), ()):
+                if p not in res:
+                    res.add(p)
+                    stack.append(p)
+
+        return res
+
+    def closure(self, pathes):
+        """
+        the live files in pathes and all files they include transitively.
+        """
+
+        res = set()
+        stack = [p for p in pathes if p in self._depends]
+        while stack:
+            p = stack.pop()
+            if p in res:
+                continue
+
+            res.add(p)
+            stack.extend(self._depends[p])
+
+        return res
+
+    def _attach(self, pathes, load, includer = None):
+        """
+        make pathes and files they include live, load(path) returns the
+        depends of a file which is not live yet, or None if the file can
+        not be read, then it is dropped from the depends of its includer.
+        returns the new files in breadth-first order, i.e. the nearest
+        ones first.
+        """
+
+        new_files = []
+        queue = deque((path, includer) for path in pathes)
+        while queue:
+            path, includer = queue.popleft()
+            if path in self._depends:
+                continue
+
+            depends = load(path)
+            if depends is None:
+                if includer is not None:
+                    self._unlink(includer, path)
+                    self._depends[includer] = \
+                        self._depends[includer] - {path}
+
+                continue
+
+            self._depends[path] = depends
+            new_files.append(path)
+
+            for d in depends:
+                self._dependents.setdefault(d, set()).add(path)
+                queue.append((d, path))
+
+        return new_files
+
+    def _unlink(self, includer, path):
+        dependents = self._dependents[path]
+        dependents.discard(includer)
+        if not dependents:
+            del self._dependents[path]
+
+    def _unreachable(self, path, dead, alive):
+        """
+        search the files including path, through files not dead, for a
+        root.  returns None if one is found, otherwise the files searched,
+        which are not reachable from any root.
+        """
+
+        searched = {path}
+        stack = [path]
+        while stack:
+            p = stack.pop()
+            if p in self._roots or p in alive:
+                return None
+
+            for q in self._dependents.get(p, ()):
+                if q not in dead and q not in searched:
+                    searched.add(q)
+                    stack.append(q)
+
+        return searched
+
+    def _detach(self, pathes):
+        """
+        pathes lost a root or an including edge, drop the files which are
+        not reachable any more.  returns the dropped files.
+        """
+
+        obsolete_files = []
+        dead = set()
+        alive = set()
+
+        # path -> number of files including it which are not dead.
+        counts = {}
+
+        # files whose includers are all dead, and files which lost some
+        # but not all of their includers.
+        stack = []
+        unsure = []
+        for p in pathes:
+            if p in self._depends and p not in counts:
+                counts[p] = len(self._dependents.get(p, ()))
+                (unsure if counts[p] else stack).append(p)
+
+        while stack or unsure:
+            # a file is dropped once all its includers are dropped, files
+            # still included are searched for a root only when no such
+            # file is left, they may be in an unreachable include cycle.
+            if stack:
+                p = stack.pop()
+                if p in dead or p in self._roots:
+                    continue
+
+                dropped = [p]
+            else:
+                p = unsure.pop()
+                if p in dead or p in alive or not counts[p]:
+                    continue
+
+                dropped = self._unreachable(p, dead, alive)
+                if dropped is None:
+                    alive.add(p)
+                    continue
+
+            dead.update(dropped)
+            obsolete_files.extend(dropped)
+            for q in dropped:
+                for d in self._depends[q]:
+                    if d in dead:
+                        continue
+
+                    if d not in counts:
+                        counts[d] = len(self._dependents.get(d, ()))
+
+                    counts[d] -= 1
+                    (unsure if counts[d] else stack).append(d)
+
+        for p in obsolete_files:
+            for d in self._depends.pop(p):
+                self._unlink(p, d)
+
+        return obsolete_files
+
+    def add_root(self, path, load):
+        """
+        returns the files which become live.
+        """
+
+        new_files = self._attach([path], load)
+        if path in self._depends:
+            self._roots[path] = self._roots.get(path, 0) + 1
+
+        return new_files
+
+    def remove_root(self, path):
+        """
+        returns the files which are not live any more.
+        """
+
+        count = self._roots.get(path, 0)
+        if count > 1:
+            self._roots[path] = count - 1
+            return []
+        elif not count:
+            return []
+
+        del self._roots[path]
+        return self._detach([path])
+
+    def set_depends(self, path, depends, load):
+        """
+        replace the depends of a live file.  returns (new files, obsolete
+        files).
+        """
+
+        old_depends = self._depends[path]
+        self._depends[path] = depends
+
+        for d in old_depends - depends:
+            self._unlink(path, d)
+
+        for d in depends - old_depends:
+            self._dependents.setdefault(d, set()).add(path)
+
+        new_files = self._attach(depends - old_depends, load, path)
+        obsolete_files = self._detach(old_depends - depends)
+        return new_files, obsolete_files
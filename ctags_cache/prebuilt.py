@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+
+"""
+The prebuilt module precompiles the headers of an include directory, e.g.
+/usr/include, into an index file which is mapped into memory instead of
+parsing the headers again in every session.
+
+the file is immutable, its layout is:
+
+    header      HEADER
+    meta        JSON: the files and their fingerprints, and the anonymous
+                structs referred by typeref in each file
+    entries     ENTRY (offset of line, file id) of every tag, sorted by
+                name
+    postings    ids of the tags of each file, as uint32
+    lines       ctags output lines, the path field is left empty
+
+tags are found by binary search over the entries, and loaded from the
+mapped lines as LazyTag, so nothing is copied until a tag is used.  the
+pages are shared by all processes which map the same file.
+
+build it by "python -m ctags_cache.prebuilt /usr/include".
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import threading
+import subprocess
+
+from .tag import LazyTag
+from .utils import typeref_to_struct_name, prefix_upper_bound
+from .ctags_table import CTAGS_CMD, STRUCT_KINDS
+from .ctags_table import split_into_shards, default_jobs
+
+MAGIC = b'CTAGSIDX'
+
+# bump it whenever the layout is changed.
+VERSION = 1
+
+# magic, version, number of tags, offset and length of meta, offsets of
+# entries, postings and lines.
+HEADER = struct.Struct('<8sIIQQQQQ')
+
+ENTRY = struct.Struct('<QI')
+
+POSTING = struct.Struct('<I')
+
+PREBUILT_DIR = '~/.cache/ctags_cache/prebuilt'
+
+def index_file(prebuilt_dir, incdir):
+    """
+    the index file of incdir in prebuilt_dir, named like vim's undo files,
+    e.g. "%usr%include.idx".
+    """
+
+    name = os.path.realpath(incdir).replace(os.sep, '%')
+    return os.path.join(os.path.expanduser(prebuilt_dir), name + '.idx')
+
+class PrebuiltIndex:
+
+    def __init__(self, path):
+        """
+        map the index file at path, raise ValueError if it is not an
+        index of this version.
+        """
+
+        self.path = path
+        with open(path, 'rb') as fobj:
+            self._mm = mmap.mmap(fobj.fileno(), 0, access = mmap.ACCESS_READ)
+
+        if len(self._mm) < HEADER.size:
+            raise ValueError("not a prebuilt index: " + path)
+
+        (magic, version, self._ntags, meta_off, meta_len, self._entries_off,
+         self._postings_off, lines_off) = HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a prebuilt index: " + path)
+
+        meta = json.loads(self._mm[meta_off:meta_off + meta_len].decode())
+
+        # file id -> (path, mtime, size, first posting, number of tags).
+        self._files = [(sys.intern(f[0]),) + tuple(f[1:])
+                       for f in meta['files']]
+        self._file_ids = dict((f[0], i) for i, f in enumerate(self._files))
+
+        # anonymous struct -> ids of files which refer to it by typeref.
+        self._anon_typerefs = {}
+        self._file_anon_typerefs = {}
+        for typeref, fid in meta['anon']:
+            self._anon_typerefs.setdefault(typeref, set()).add(fid)
+            self._file_anon_typerefs.setdefault(fid, []).append(typeref)
+
+        # tags which have been found, so a tag is loaded only once.
+        self._tags = {}
+
+    def __len__(self):
+        return self._ntags
+
+    def covers(self, path):
+        """
+        return the id of file path if its tags are in the index and it is
+        not changed since the index was built, otherwise None.
+        """
+
+        fid = self._file_ids.get(path)
+        if fid is None:
+            return None
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        if (st.st_mtime_ns, st.st_size) != self._files[fid][1:3]:
+            return None
+
+        return fid
+
+    def file_tags(self, fid):
+        return self._files[fid][4]
+
+    def file_names(self, fid):
+        """
+        names of the tags of file fid.
+        """
+
+        first, count = self._files[fid][3:5]
+        start = self._postings_off + first * POSTING.size
+        return [self._name(self._entry(i)[0]).decode('utf-8', 'replace')
+                for i, in POSTING.iter_unpack(
+                        self._mm[start:start + count * POSTING.size])]
+
+    def file_anon_typerefs(self, fid):
+        return self._file_anon_typerefs.get(fid, ())
+
+    def referred(self, typeref, live):
+        """
+        whether typeref is referred by any file in live.
+        """
+
+        return any(fid in live for fid in self._anon_typerefs.get(typeref, ()))
+
+    def _entry(self, i):
+        return ENTRY.unpack_from(self._mm, self._entries_off + i * ENTRY.size)
+
+    def _name(self, off):
+        return self._mm[off:self._mm.find(b'\t', off)]
+
+    def _bisect(self, key):
+        # the first tag whose name is not less than key, names are sorted
+        # as utf-8 bytes, which is the order of str.
+        lo = 0
+        hi = self._ntags
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(self._entry(mid)[0]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo
+
+    def find(self, name_prefix, match_whole, live):
+        """
+        tags of files in live, like CtagsTableView.find().
+        """
+
+        key = name_prefix.encode('utf-8')
+        lo = self._bisect(key)
+        if match_whole:
+            # no name has a NUL, key + NUL is greater than key only.
+            hi = self._bisect(key + b'\0')
+        else:
+            upper = prefix_upper_bound(name_prefix)
+            hi = self._bisect(upper.encode('utf-8')) if upper else self._ntags
+
+        start = self._entries_off + lo * ENTRY.size
+        entries = ENTRY.iter_unpack(self._mm[start:start +
+                                             (hi - lo) * ENTRY.size])
+        res = []
+        tags = self._tags
+        for i, (off, fid) in enumerate(entries, lo):
+            if fid not in live:
+                continue
+
+            tag = tags.get(i)
+            if tag is None:
+                tag = LazyTag(self._name(off).decode('utf-8', 'replace'),
+                              self._files[fid][0], self._mm, off)
+                tag = tags.setdefault(i, tag)
+
+            res.append(tag)
+
+        return res
+
+    def members(self, scope, live):
+        """
+        return (member tags of scope, child scope -> kind of it).
+        """
+
+        res = []
+        children = {}
+        for tag in self.find(scope + '::', 0, live):
+            if tag.scope_kind not in STRUCT_KINDS:
+                continue
+
+            if tag.scope == scope:
+                res.append(tag)
+            elif tag.scope.rpartition('::')[0] == scope:
+                children[tag.scope] = tag.scope_kind
+
+        return res, children
+
+def _header_files(incdir):
+    # symlinked dirs are followed, as headers are resolved through them,
+    # but each real dir is listed once.
+    seen = set()
+    for dirpath, dirnames, filenames in os.walk(incdir, followlinks = True):
+        real = os.path.realpath(dirpath)
+        if real in seen:
+            dirnames[:] = []
+            continue
+
+        seen.add(real)
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.endswith('.h'):
+                yield os.path.join(dirpath, name)
+
+def _run_ctags(file_list):
+    p = subprocess.Popen(CTAGS_CMD, shell = True, stdin = subprocess.PIPE,
+                         stdout = subprocess.PIPE)
+    out, err = p.communicate('\n'.join(file_list).encode('utf-8'))
+    return out
+
+def _typeref(rest):
+    # the typeref field of the rest of a line after its path.
+    start = rest.find(b'\ttyperef:')
+    if start < 0:
+        return None
+
+    start += len(b'\ttyperef:')
+    end = rest.find(b'\t', start)
+    return rest[start:end if end >= 0 else len(rest)].decode('utf-8',
+                                                             'replace')
+
+def build_index(incdir, output, jobs = 0):
+    """
+    run ctags over the headers in incdir and write the index to output.
+    returns the number of (files, tags).
+    """
+
+    incdir = os.path.realpath(incdir)
+    file_list = list(_header_files(incdir))
+
+    # fingerprints are taken before ctags reads the files, a file changed
+    # while building is parsed again when it is used.
+    files = []
+    file_ids = {}
+    for path in file_list:
+        st = os.stat(path)
+        file_ids[path] = len(files)
+        files.append([path, st.st_mtime_ns, st.st_size, 0, 0])
+
+    shards = split_into_shards(file_list, jobs or default_jobs())
+    outputs = [None] * len(shards)
+    def run_shard(n):
+        outputs[n] = _run_ctags(shards[n])
+
+    threads = [threading.Thread(target = run_shard, args = (n,))
+               for n in range(len(shards))]
+    for t in threads:
+        t.start()
+
+    for t in threads:
+        t.join()
+
+    lines = []
+    anon = set()
+    for out in outputs:
+        for line in out.split(b'\n'):
+            fields = line.split(b'\t', 2)
+            if len(fields) < 3:
+                continue
+
+            name, path, rest = fields
+            fid = file_ids.get(path.decode('utf-8', 'replace'))
+            if fid is None:
+                continue
+
+            lines.append((name, fid, name + b'\t\t' + rest + b'\n'))
+            if b'__anon' in rest:
+                typeref = _typeref(rest)
+                if typeref and '__anon' in typeref:
+                    anon.add((typeref_to_struct_name(typeref), fid))
+
+    lines.sort(key = lambda x: x[0])
+
+    postings = [[] for f in files]
+    for i, (name, fid, line) in enumerate(lines):
+        postings[fid].append(i)
+
+    first = 0
+    for fid, f in enumerate(files):
+        f[3] = first
+        f[4] = len(postings[fid])
+        first += f[4]
+
+    meta = json.dumps({'incdir': incdir, 'files': files,
+                       'anon': sorted(anon)}).encode('utf-8')
+
+    meta_off = HEADER.size
+    entries_off = meta_off + len(meta)
+    postings_off = entries_off + len(lines) * ENTRY.size
+    lines_off = postings_off + len(lines) * POSTING.size
+
+    os.makedirs(os.path.dirname(output) or '.', exist_ok = True)
+
+    # replaced as a whole, processes which mapped the old file keep it.
+    tmp_file = output + '.tmp'
+    with open(tmp_file, 'wb') as fobj:
+        fobj.write(HEADER.pack(MAGIC, VERSION, len(lines), meta_off,
+                               len(meta), entries_off, postings_off,
+                               lines_off))
+        fobj.write(meta)
+
+        off = lines_off
+        for name, fid, line in lines:
+            fobj.write(ENTRY.pack(off, fid))
+            off += len(line)
+
+        for ids in postings:
+            for i in ids:
+                fobj.write(POSTING.pack(i))
+
+        for name, fid, line in lines:
+            fobj.write(line)
+
+    os.replace(tmp_file, output)
+    return len(files), len(lines)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+            description = "precompile include dirs into index files, "
+                          "which are used when the dirs are in the include "
+                          "list.")
+    parser.add_argument('dirs', nargs = '+')
+    parser.add_argument('-o', '--output-dir', default = PREBUILT_DIR)
+    parser.add_argument('--jobs', type = int, default = 0)
+    args = parser.parse_args()
+
+    for incdir in args.dirs:
+        output = index_file(args.output_dir, incdir)
+        files, tags = build_index(incdir, output, args.jobs)
+        print('%s: %d files, %d tags' % (output, files, tags))
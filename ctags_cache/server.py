@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+
+"""
+The server module shares one CtagsCache between many vim instances.
+
+the server listens on a unix socket, each client sends one JSON request
+per line and gets one JSON response per line.  the first request of a
+connection is "open", which selects the cache by file type and include
+list, so editors with the same include list share tags.  files added by
+a client are removed when it disconnects, and a cache is closed when its
+last client disconnects.
+
+run the server by "python -m ctags_cache.server".
+"""
+
+import os
+import sys
+import json
+import socket
+import threading
+import socketserver
+
+from . import CtagsCache, PRIORITY_BACKGROUND
+from .warm_tier import WARM_TAGS, WARM_BYTES
+from .prebuilt import PREBUILT_DIR
+
+def default_socket_path():
+    rundir = os.environ.get('XDG_RUNTIME_DIR') or '/tmp'
+    return os.path.join(rundir, 'ctags_cache-%d.sock' % os.getuid())
+
+def _tag_to_dict(tag):
+    return dict(tag.items())
+
+class CtagsCacheServer(socketserver.ThreadingMixIn,
+                       socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, jobs = 0, watch = 0,
+                 warm_tags = WARM_TAGS, warm_bytes = WARM_BYTES,
+                 prebuilt_dir = PREBUILT_DIR):
+        # (filetype, include list) -> [cache, number of clients].
+        self._caches = {}
+        self._caches_lock = threading.Lock()
+        self._jobs = jobs
+        self._watch = watch
+        self._warm_tags = warm_tags
+        self._warm_bytes = warm_bytes
+        self._prebuilt_dir = prebuilt_dir
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        socketserver.UnixStreamServer.__init__(self, socket_path,
+                                               CtagsCacheHandler)
+        os.chmod(socket_path, 0o600)
+
+    def get_cache(self, filetype, inclist):
+        """
+        returns (key, cache), release the key by put_cache() when the
+        client is done with the cache.
+        """
+
+        key = (filetype, tuple(inclist))
+        with self._caches_lock:
+            entry = self._caches.get(key)
+            if not entry:
+                cache = CtagsCache(filetype, inclist, self._jobs,
+                                   self._watch, self._warm_tags,
+                                   self._warm_bytes, self._prebuilt_dir)
+                entry = self._caches[key] = [cache, 0]
+
+            entry[1] += 1
+            return key, entry[0]
+
+    def put_cache(self, key):
+        """
+        close the cache if no client uses it any more, its worker, file
+        watcher and ctags processes are stopped.
+        """
+
+        with self._caches_lock:
+            entry = self._caches[key]
+            entry[1] -= 1
+            if entry[1]:
+                return
+
+            del self._caches[key]
+
+        entry[0].close()
+
+class CtagsCacheHandler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        socketserver.StreamRequestHandler.setup(self)
+        self._key = None
+        self._cache = None
+
+        # path -> number of adds not removed by this client.
+        self._added = {}
+
+    def _count(self, pathes, delta):
+        for path in pathes:
+            n = self._added.get(path, 0) + delta
+            if n > 0:
+                self._added[path] = n
+            else:
+                self._added.pop(path, None)
+
+    def _handle_request(self, req):
+        op = req['op']
+        if op == 'open':
+            self._release()
+            self._key, self._cache = self.server.get_cache(
+                    req['filetype'], req.get('inclist', []))
+            return None
+
+        cache = self._cache
+        if op == 'add':
+            cache.add_files(req['files'],
+                            req.get('priority', PRIORITY_BACKGROUND))
+            self._count(req['files'], 1)
+        elif op == 'update':
+            cache.update_files(req['files'])
+        elif op == 'remove':
+            # only files added by this client can be removed.
+            files = [f for f in req['files'] if f in self._added]
+            cache.remove_files(files)
+            self._count(files, -1)
+        elif op == 'find':
+            tags = cache.find_tags(req['name'], req.get('match_whole', 0),
+                                   req.get('fresh', 0))
+            return [_tag_to_dict(t) for t in tags]
+        elif op == 'members':
+            tags = cache.find_members(req['scope'], req.get('fresh', 0))
+            return [_tag_to_dict(t) for t in tags]
+        elif op == 'stats':
+            return cache.stats(req.get('reset', 0))
+        elif op == 'generation':
+            return cache.generation()
+        elif op == 'progress':
+            return cache.progress()
+        elif op == 'save':
+            cache.save(req['path'])
+        elif op == 'load':
+            cache.load(req['path'])
+        else:
+            raise ValueError("unknown op: " + op)
+
+        return None
+
+    def handle(self):
+        try:
+            for line in self.rfile:
+                try:
+                    res = {'result': self._handle_request(json.loads(line))}
+                except Exception as e:
+                    res = {'error': '%s: %s' % (type(e).__name__, e)}
+
+                self.wfile.write(json.dumps(res).encode('utf-8') + b'\n')
+                self.wfile.flush()
+
+        except OSError:
+            pass
+
+    def _release(self):
+        if not self._cache:
+            return
+
+        for path, n in self._added.items():
+            self._cache.remove_files([path] * n)
+
+        self._added = {}
+        self.server.put_cache(self._key)
+        self._key = None
+        self._cache = None
+
+    def finish(self):
+        self._release()
+
+        try:
+            socketserver.StreamRequestHandler.finish(self)
+        except OSError:
+            pass
+
+class ServerError(OSError):
+    """
+    a request failed in the server, it is an OSError like the failures
+    of the connection, so callers handle both in the same way.
+    """
+
+class CtagsCacheClient:
+    """
+    a proxy of CtagsCache in the server, it has the same methods.
+    connecting raises OSError if the server is not running.
+    """
+
+    def __init__(self, socket_path, filetype, inclist = []):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(socket_path)
+        self._rfile = self._sock.makefile('rb')
+        self._lock = threading.Lock()
+
+        inclist = [os.path.realpath(path) for path in inclist]
+        self._request({'op': 'open', 'filetype': filetype,
+                       'inclist': inclist})
+
+    def _request(self, req):
+        with self._lock:
+            self._sock.sendall(json.dumps(req).encode('utf-8') + b'\n')
+            line = self._rfile.readline()
+
+        if not line:
+            raise ConnectionError("ctags_cache server closed connection")
+
+        res = json.loads(line)
+        if 'error' in res:
+            raise ServerError(res['error'])
+
+        return res['result']
+
+    def _realpathes(self, pathes):
+        return [os.path.realpath(path) for path in pathes]
+
+    def add_files(self, pathes, priority = PRIORITY_BACKGROUND):
+        self._request({'op': 'add', 'files': self._realpathes(pathes),
+                       'priority': priority})
+
+    def update_files(self, pathes):
+        self._request({'op': 'update', 'files': self._realpathes(pathes)})
+
+    def remove_files(self, pathes):
+        self._request({'op': 'remove', 'files': self._realpathes(pathes)})
+
+    def find_tags(self, name_prefix, match_whole = 0, fresh = 0):
+        return self._request({'op': 'find', 'name': name_prefix,
+                              'match_whole': match_whole, 'fresh': fresh})
+
+    def find_members(self, scope, fresh = 0):
+        return self._request({'op': 'members', 'scope': scope,
+                              'fresh': fresh})
+
+    def generation(self):
+        return self._request({'op': 'generation'})
+
+    def stats(self, reset = 0):
+        return self._request({'op': 'stats', 'reset': reset})
+
+    def progress(self):
+        return self._request({'op': 'progress'})
+
+    def lookup(self, key, func):
+        # every find is answered by the server, nothing to memoize.
+        return func(self)
+
+    def save(self, cache_file):
+        self._request({'op': 'save', 'path': cache_file})
+
+    def load(self, cache_file):
+        self._request({'op': 'load', 'path': cache_file})
+
+    def close(self):
+        self._rfile.close()
+        self._sock.close()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+            description = "share tags between vim instances.")
+    parser.add_argument('--socket', default = default_socket_path())
+    parser.add_argument('--jobs', type = int, default = 0)
+    parser.add_argument('--watch', action = 'store_true')
+    parser.add_argument('--warm-tags', type = int, default = WARM_TAGS)
+    parser.add_argument('--warm-bytes', type = int, default = WARM_BYTES)
+    parser.add_argument('--prebuilt-dir', default = PREBUILT_DIR)
+    args = parser.parse_args()
+
+    server = CtagsCacheServer(args.socket, args.jobs, args.watch,
+                              args.warm_tags, args.warm_bytes,
+                              args.prebuilt_dir)
+    print("listening on", args.socket, file = sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        os.unlink(args.socket)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+"""
+The stats module counts what a CtagsCache does and how long it takes, to
+tell whether ctags, the index or something else is slow.
+"""
+
+import time
+import threading
+
+class Histogram:
+    """
+    values in buckets of powers of 2, e.g. seconds from 1us to minutes,
+    which is enough to estimate percentiles.
+    """
+
+    # the upper bound of the first bucket.
+    BASE = 1e-6
+
+    def __init__(self, base = BASE):
+        self._base = base
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = []
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+        i = 0
+        bound = self._base
+        while value > bound:
+            i += 1
+            bound *= 2
+
+        if i >= len(self.buckets):
+            self.buckets += [0] * (i + 1 - len(self.buckets))
+
+        self.buckets[i] += 1
+
+    def percentile(self, p):
+        """
+        the upper bound of the bucket which has the p-th percentile.
+        """
+
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(self._base * 2 ** i, self.max)
+
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+class Timer:
+
+    def __init__(self, stats, name):
+        self._stats = stats
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._stats.observe(self._name, time.perf_counter() - self._start)
+
+class Stats:
+    """
+    named counters and histograms, it is used by many threads.  the names
+    of histograms of seconds end with '_time'.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def count(self, name, n = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if not histogram:
+                # sizes are counted from 1.
+                base = Histogram.BASE if name.endswith('_time') else 1
+                histogram = self._histograms[name] = Histogram(base)
+
+            histogram.add(value)
+
+    def timer(self, name):
+        """
+        "with stats.timer(name):" observes seconds the block takes.
+        """
+
+        return Timer(self, name)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'histograms': dict((name, h.as_dict()) for name, h in
+                                   self._histograms.items()),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+def format_stats(stats):
+    """
+    lines of text for a dict returned by CtagsCache.stats().
+    """
+
+    lines = []
+    for name, value in sorted(stats.items()):
+        if name not in ('counters', 'histograms'):
+            lines.append('%s: %s' % (name, value))
+
+    for name, value in sorted(stats.get('counters', {}).items()):
+        lines.append('%s: %d' % (name, value))
+
+    for name, h in sorted(stats.get('histograms', {}).items()):
+        if name.endswith('_time'):
+            fmt = ('%s: count %d total %.3fs mean %.6fs p50 %.6fs '
+                   'p90 %.6fs p99 %.6fs max %.6fs')
+        else:
+            fmt = ('%s: count %d total %d mean %.1f p50 %d p90 %d p99 %d '
+                   'max %d')
+
+        lines.append(fmt % (name, h['count'], h['total'], h['mean'],
+                            h['p50'], h['p90'], h['p99'], h['max']))
+
+    return lines
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+"""
+The tag module supplied a compact record for one ctags tag.
+"""
+
+import sys
+
+# fields of ctags output whose value is the scope of tag.
+SCOPE_KINDS = frozenset(['struct', 'union', 'class', 'enum', 'function',
+                         'namespace', 'interface'])
+
+class Tag:
+    """
+    one tag generated by ctags.
+
+    there are millions of tags, so each tag is a __slots__ record instead
+    of a dict, and the repeated strings (path, kind, scope, typeref) are
+    interned.  however, a tag still looks like a dict which has fields:
+    name, path, address, kind, signature, typeref, file, and the scope
+    field named by its kind, e.g. tag['struct'].
+    """
+
+    __slots__ = ('name', 'path', 'address', 'kind', 'scope_kind', 'scope',
+                 'signature', 'typeref', 'file', 'extra')
+
+    def __init__(self, name, path, address):
+        self.name = name
+        self.path = sys.intern(path)
+        self.address = int(address) if address.isdigit() else address
+        self.kind = None
+        self.scope_kind = None
+        self.scope = None
+        self.signature = None
+        self.typeref = None
+        self.file = None
+        self.extra = None
+
+    def set_field(self, field, value):
+        if field == 'kind':
+            self.kind = sys.intern(value)
+        elif field == 'typeref':
+            self.typeref = sys.intern(value)
+        elif field == 'signature':
+            self.signature = value
+        elif field == 'file':
+            self.file = True
+        elif field in SCOPE_KINDS:
+            self.scope_kind = sys.intern(field)
+            self.scope = sys.intern(value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[field] = value
+
+    def _get(self, key):
+        if key == 'name':
+            return self.name
+        elif key == 'path':
+            return self.path
+        elif key == 'address':
+            return str(self.address)
+        elif key == 'kind':
+            return self.kind
+        elif key == 'signature':
+            return self.signature
+        elif key == 'typeref':
+            return self.typeref
+        elif key == 'file':
+            return '' if self.file else None
+        elif key == self.scope_kind:
+            return self.scope
+        elif self.extra:
+            return self.extra.get(key)
+        else:
+            return None
+
+    def __getitem__(self, key):
+        value = self._get(key)
+        if value is None:
+            raise KeyError(key)
+
+        return value
+
+    def __contains__(self, key):
+        return self._get(key) is not None
+
+    def get(self, key, default = None):
+        value = self._get(key)
+        return default if value is None else value
+
+    def keys(self):
+        res = ['name', 'path', 'address']
+        for key in ('kind', 'signature', 'typeref', 'file'):
+            if self._get(key) is not None:
+                res.append(key)
+
+        if self.scope_kind:
+            res.append(self.scope_kind)
+
+        if self.extra:
+            res += list(self.extra)
+
+        return res
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        return [(key, self._get(key)) for key in self.keys()]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+class LazyTag:
+    """
+    a tag which keeps only its name, path and the position of its line in
+    a buffer of ctags output, e.g. a mapped prebuilt index.  other fields
+    are parsed when they are used for the first time.
+    """
+
+    __slots__ = ('name', 'path', '_buf', '_off', '_tag')
+
+    def __init__(self, name, path, buf, off):
+        self.name = name
+        self.path = path
+        self._buf = buf
+        self._off = off
+        self._tag = None
+
+    def load(self):
+        # tags in a snapshot are loaded by any thread.  _tag is set before
+        # _buf is cleared, so if _buf is gone, _tag is there.  two threads
+        # may parse the same line, both results are equal.
+        tag = self._tag
+        if tag is not None:
+            return tag
+
+        buf = self._buf
+        if buf is None:
+            return self._tag
+
+        # imported here, the ctags_table module imports this module.
+        from .ctags_table import parse_ctags_line
+
+        end = buf.find(b'\n', self._off)
+        if end < 0:
+            end = len(buf)
+
+        tag = parse_ctags_line(buf[self._off:end].decode('utf-8', 'replace')
+                               + '\n')
+        tag.name = self.name
+        tag.path = self.path
+        self._tag = tag
+        self._buf = None
+        return tag
+
+    def __getattr__(self, attr):
+        # e.g. pickle looks up __setstate__ before slots are restored.
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+
+        return getattr(self.load(), attr)
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __contains__(self, key):
+        return key in self.load()
+
+    def get(self, key, default = None):
+        return self.load().get(key, default)
+
+    def keys(self):
+        return self.load().keys()
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def items(self):
+        return self.load().items()
+
+    def __repr__(self):
+        return repr(self.load())
+
+if __name__ == "__main__":
+    # compare memory of tags stored as dicts and as Tag records, run it
+    # by "python -m ctags_cache.tag".
+    import tracemalloc
+    from ctags_cache.ctags_table import parse_ctags_output
+
+    def parse_as_dict(data):
+        res = []
+        for line in data.decode('utf-8').splitlines():
+            name, path, rest = line.split('\t', 2)
+            address, sep, rest = rest.partition(';"\t')
+            tag = {'name': name, 'path': path, 'address': address}
+            for field in rest.split('\t'):
+                key, sep, value = field.partition(':')
+                tag[key] = value
+
+            res.append(tag)
+
+        return res
+
+    lines = []
+    for i in range(200000):
+        lines.append('member_%d\t/usr/include/linux/header_%d.h\t%d;"\t'
+                     'kind:m\tstruct:struct_%d\ttyperef:struct:type_%d\n' %
+                     (i, i // 500, i % 5000, i // 20, i % 100))
+
+    data = ''.join(lines).encode('utf-8')
+
+    for parser in (parse_as_dict, parse_ctags_output):
+        tracemalloc.start()
+        tags = parser(data)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del tags
+
+        print(parser.__name__, 'bytes per tag:', size // len(lines))
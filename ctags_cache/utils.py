@@ -4,74 +4,227 @@
 The utils module supplied some tools.
 """
 
-def binary_search(li, matcher):
+from bisect import bisect_left, bisect_right
+
+def typeref_to_struct_name(typeref):
+    """
+    the 'typeref' field is generated by ctags, it may contain many
+    middle struct name, we don't need them. but, the "__anon*" struct is
+    useful, should keep it.
+    """
+    kind, sep, name = typeref.partition(':')
+    name_parts = name.split('::')
+    name_parts.reverse()
+    name = []
+    for s in name_parts:
+        name.insert(0, s)
+        if not s.startswith('__anon'):
+            break
+
+    return kind + sep + "::".join(name)
+
+def prefix_upper_bound(prefix):
     """
-    find position in li, where matcher() first returns '='.
-
-    the matcher() receives a argument which is the element in list 'li',
-    and returns '=', '<', '>' to indicates match result.
-
-    for example, we can define a matcher() to match number 1:
-        def matcher(key):
-            if key == 1:
-                return '='
-            elif key > 1:
-                return '>'
-            elif key < 1:
-                return '<'
+    return the least string which is greater than all strings starting
+    with prefix, or None if there is no such string.
     """
 
-    # do some check.
-    if len(li) == 0 or matcher(li[0]) == '>' or matcher(li[-1]) == '<':
+    while prefix and prefix[-1] == chr(0x10ffff):
+        prefix = prefix[:-1]
+
+    if not prefix:
         return None
 
-    # do real work.
-    def _binary_search(li, matcher, lo, hi):
-        mi = lo + (hi - lo) // 2
-        ret = matcher(li[mi])
- 
-        if hi == lo:
-            if ret == '=':
-                return mi
-            else:
-                return None
- 
-        if ret == '=':
-            ret = _binary_search(li, matcher, lo, mi)
-            if ret != None:
-                return ret
- 
-            return mi
- 
-        elif ret == '>':
-            return _binary_search(li, matcher, lo, mi)
- 
-        elif ret == '<':
-            return _binary_search(li, matcher, mi + 1, hi)
- 
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+class SortedChunkList:
+    """
+    a list kept sorted by key(item), which is split into chunks.
+
+    adding or removing one item costs O(log n) to find its chunk plus a
+    memmove inside the chunk, so it is cheap to add or remove the tags
+    of one file from millions of tags.
+
+    snapshot() returns a read-only copy which shares chunks with the
+    list, a shared chunk is copied when the list modifies it.
+    """
+
+    # chunks are split when they grow up to twice of it.
+    LOAD = 512
+
+    def __init__(self, key):
+        self._key = key
+        self._chunks = []
+        self._keys = []
+        self._maxes = []
+        self._len = 0
+
+        # ids of chunks not shared with snapshots, None if there is no
+        # snapshot at all.
+        self._owned = None
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield from chunk
+
+    def snapshot(self):
+        view = SortedChunkList(self._key)
+        view._chunks = list(self._chunks)
+        view._keys = list(self._keys)
+        view._maxes = list(self._maxes)
+        view._len = self._len
+
+        self._owned = set()
+        return view
+
+    def _own(self, chunk):
+        if self._owned is not None:
+            self._owned.add(id(chunk))
+
+    def _writable(self, i):
+        """
+        return chunk i and its keys, copy them first if they are shared.
+        """
+
+        chunk = self._chunks[i]
+        if self._owned is not None and id(chunk) not in self._owned:
+            chunk = self._chunks[i] = list(chunk)
+            self._keys[i] = list(self._keys[i])
+            self._own(chunk)
+
+        return chunk, self._keys[i]
+
+    def _rebuild(self, items):
+        items.sort(key = self._key)
+        self._chunks = []
+        self._keys = []
+        self._maxes = []
+        for i in range(0, len(items), self.LOAD):
+            chunk = items[i:i + self.LOAD]
+            keys = [self._key(item) for item in chunk]
+            self._own(chunk)
+            self._chunks.append(chunk)
+            self._keys.append(keys)
+            self._maxes.append(keys[-1])
+
+        self._len = len(items)
+
+    def add(self, item):
+        k = self._key(item)
+        if not self._maxes:
+            chunk = [item]
+            self._own(chunk)
+            self._chunks.append(chunk)
+            self._keys.append([k])
+            self._maxes.append(k)
+            self._len += 1
+            return
+
+        i = bisect_right(self._maxes, k)
+        if i == len(self._maxes):
+            i -= 1
+            chunk, keys = self._writable(i)
+            chunk.append(item)
+            keys.append(k)
+            self._maxes[i] = k
         else:
-            print("matcher function returned unknown value")
-            return None
+            chunk, keys = self._writable(i)
+            j = bisect_right(keys, k)
+            keys.insert(j, k)
+            chunk.insert(j, item)
+
+        self._len += 1
+
+        if len(chunk) > self.LOAD * 2:
+            halves = [chunk[:self.LOAD], chunk[self.LOAD:]]
+            for half in halves:
+                self._own(half)
+
+            self._chunks[i:i + 1] = halves
+            self._keys[i:i + 1] = [keys[:self.LOAD], keys[self.LOAD:]]
+            self._maxes[i:i + 1] = [keys[self.LOAD - 1], keys[-1]]
+
+    def update(self, items):
+        # many new items, sorting all is cheaper than inserting them.
+        if len(items) > self._len:
+            self._rebuild(list(self) + list(items))
+            return
+
+        for item in items:
+            self.add(item)
+
+    def remove(self, item):
+        """
+        remove the item itself (not an equal one), return whether it
+        was found.
+        """
+
+        k = self._key(item)
+        i = bisect_left(self._maxes, k)
+        while i < len(self._maxes):
+            keys = self._keys[i]
+            chunk = self._chunks[i]
+            j = bisect_left(keys, k)
+            while j < len(keys) and keys[j] == k:
+                if chunk[j] is item:
+                    chunk, keys = self._writable(i)
+                    del keys[j]
+                    del chunk[j]
+                    self._len -= 1
+                    if not chunk:
+                        del self._chunks[i]
+                        del self._keys[i]
+                        del self._maxes[i]
+                    else:
+                        self._maxes[i] = keys[-1]
 
-    return _binary_search(li, matcher, 0, len(li) - 1)
+                    return 1
+
+                j += 1
+
+            if j < len(keys):
+                break
+
+            i += 1
+
+        return 0
+
+    def irange(self, lo, hi = None, inclusive = 0):
+        """
+        return list of items whose key is in [lo, hi), or [lo, hi] if
+        inclusive.  hi is None means no upper bound.
+        """
+
+        n = len(self._maxes)
+        first = bisect_left(self._maxes, lo)
+        if hi is None:
+            last = n - 1
+        else:
+            bis = bisect_right if inclusive else bisect_left
+            last = min(bis(self._maxes, hi), n - 1)
+
+        res = []
+        for i in range(first, last + 1):
+            keys = self._keys[i]
+            start = bisect_left(keys, lo) if i == first else 0
+            end = bis(keys, hi) if i == last and hi is not None else len(keys)
+            res += self._chunks[i][start:end]
+
+        return res
 
 if __name__ == "__main__":
     cb_header = """
-import utils
-li = [ i for i in range(1, 1000000) ]
-def matcher(key):
-    if key == 999999:
-        return '='
-    if key < 999999:
-        return '<'
-    if key > 999999:
-        return '>'
+from ctags_cache import utils
+li = utils.SortedChunkList(lambda x: x)
+li.update(['%07d' % i for i in range(1000000)])
     """
 
-    cb_body = "utils.binary_search(li, matcher)"
+    cb_body = "li.irange('099999', utils.prefix_upper_bound('099999'))"
 
     import timeit
 
     timer = timeit.Timer(cb_body, cb_header)
-    print(timer.timeit(1))
-
+    print(timer.timeit(1000) / 1000)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+"""
+The warm_tier module remembers files which are no longer reachable from
+any added file, so their tags can be used again if they come back soon,
+e.g. a buffer is closed by ":bd" and opened again.
+"""
+
+from collections import OrderedDict
+
+# limits of the warm files: their number of tags, and their total size
+# in bytes, which is about how much memory their tags take.
+WARM_TAGS = 200000
+WARM_BYTES = 64 * 1024 * 1024
+
+class WarmTier:
+    """
+    the least recently retired files are evicted first when any limit is
+    exceeded.  a limit of 0 keeps no file.
+    """
+
+    def __init__(self, max_tags = WARM_TAGS, max_bytes = WARM_BYTES):
+        self._max_tags = max_tags
+        self._max_bytes = max_bytes
+
+        # path -> (tags, bytes), the least recently retired first.
+        self._files = OrderedDict()
+        self.tags = 0
+        self.bytes = 0
+
+    def __contains__(self, path):
+        return path in self._files
+
+    def __len__(self):
+        return len(self._files)
+
+    def retire(self, path, tags, size):
+        """
+        keep path, return the paths evicted to make room for it, which may
+        include path itself if it alone exceeds a limit.
+        """
+
+        self.discard(path)
+        self._files[path] = (tags, size)
+        self.tags += tags
+        self.bytes += size
+
+        evicted = []
+        while self._files and (self.tags > self._max_tags or
+                               self.bytes > self._max_bytes):
+            evicted.append(self._pop(next(iter(self._files))))
+
+        return evicted
+
+    def _pop(self, path):
+        tags, size = self._files.pop(path)
+        self.tags -= tags
+        self.bytes -= size
+        return path
+
+    def discard(self, path):
+        """
+        forget path, e.g. it is revived or its tags are out of date.
+        """
+
+        if path in self._files:
+            self._pop(path)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+"""
+The watcher module notices files changed outside vim, e.g. by "git
+checkout" or a build which regenerates headers.
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+import threading
+import traceback
+
+# wait until no file changed for this many seconds, so a burst of changes
+# like switching branches is reported once.
+DEBOUNCE_DELAY = 0.3
+
+# but do not wait longer than this if files keep changing.
+MAX_DELAY = 3.0
+
+# seconds between two scans of PollingWatcher.
+POLL_INTERVAL = 2.0
+
+class FileWatcher(threading.Thread):
+    """
+    watches a set of files in a thread and calls callback(pathes) with the
+    changed files, after the changes calm down.  subclasses implement
+    _wait(timeout), which returns the changed files.
+    """
+
+    def __init__(self, callback, delay = DEBOUNCE_DELAY):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._callback = callback
+        self._delay = delay
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._paths = set()
+        self._pending = set()
+
+    def add_paths(self, pathes):
+        with self._lock:
+            for path in pathes:
+                if path not in self._paths:
+                    self._paths.add(path)
+                    self._watch(path)
+
+    def remove_paths(self, pathes):
+        with self._lock:
+            for path in pathes:
+                if path in self._paths:
+                    self._paths.discard(path)
+                    self._unwatch(path)
+
+    def _watch(self, path):
+        pass
+
+    def _unwatch(self, path):
+        pass
+
+    def _wait(self, timeout):
+        raise NotImplementedError
+
+    def run(self):
+        first = last = 0
+        while not self._stopped.is_set():
+            changed = self._wait(self._delay if self._pending else 1.0)
+
+            now = time.monotonic()
+            if changed:
+                if not self._pending:
+                    first = now
+
+                self._pending.update(changed)
+                last = now
+
+            if self._pending and (now - last >= self._delay or
+                                  now - first >= MAX_DELAY):
+                pathes = sorted(self._pending)
+                self._pending.clear()
+                try:
+                    self._callback(pathes)
+                except Exception:
+                    traceback.print_exc()
+
+    def close(self):
+        self._stopped.set()
+
+class PollingWatcher(FileWatcher):
+    """
+    stat()s every watched file periodically, it works everywhere.
+    """
+
+    def __init__(self, callback, delay = DEBOUNCE_DELAY,
+                 interval = POLL_INTERVAL):
+        FileWatcher.__init__(self, callback, delay)
+        self._interval = interval
+        self._stats = {}
+        self._next_scan = time.monotonic() + interval
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _watch(self, path):
+        self._stats[path] = self._stat(path)
+
+    def _unwatch(self, path):
+        self._stats.pop(path, None)
+
+    def _wait(self, timeout):
+        now = time.monotonic()
+        if now < self._next_scan:
+            self._stopped.wait(min(timeout, self._next_scan - now))
+            return []
+
+        self._next_scan = now + self._interval
+        with self._lock:
+            pathes = list(self._stats)
+
+        changed = []
+        for path in pathes:
+            st = self._stat(path)
+            with self._lock:
+                if path in self._stats and self._stats[path] != st:
+                    self._stats[path] = st
+                    changed.append(path)
+
+        return changed
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# modifications are reported by IN_CLOSE_WRITE.  files are watched by
+# their directories, since editors and git replace files by renaming.
+IN_WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                 IN_CREATE | IN_DELETE | IN_ONLYDIR)
+
+class InotifyWatcher(FileWatcher):
+    """
+    uses inotify of linux by ctypes, raises OSError if it is not
+    available.
+    """
+
+    def __init__(self, callback, delay = DEBOUNCE_DELAY):
+        import ctypes
+        import ctypes.util
+
+        FileWatcher.__init__(self, callback, delay)
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+            self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except AttributeError:
+            raise OSError(errno.ENOSYS, "inotify is not supported")
+
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        # dir -> [watch descriptor, number of watched files in it].
+        self._dirs = {}
+        self._wds = {}
+
+    def _watch(self, path):
+        dirname = os.path.dirname(path)
+        watch = self._dirs.get(dirname)
+        if watch:
+            watch[1] += 1
+            return
+
+        wd = self._add_watch(self._fd, os.fsencode(dirname), IN_WATCH_MASK)
+        self._dirs[dirname] = [wd, 1]
+        if wd >= 0:
+            self._wds[wd] = dirname
+
+    def _unwatch(self, path):
+        dirname = os.path.dirname(path)
+        watch = self._dirs[dirname]
+        watch[1] -= 1
+        if watch[1] > 0:
+            return
+
+        del self._dirs[dirname]
+        if watch[0] >= 0:
+            self._rm_watch(self._fd, watch[0])
+            self._wds.pop(watch[0], None)
+
+    def _wait(self, timeout):
+        readable = select.select([self._fd], [], [], timeout)[0]
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return []
+
+        changed = []
+        with self._lock:
+            off = 0
+            while off < len(data):
+                wd, mask, cookie, size = struct.unpack_from('iIII', data, off)
+                name = data[off + 16:off + 16 + size].rstrip(b'\0')
+                off += 16 + size
+
+                if mask & IN_Q_OVERFLOW:
+                    return list(self._paths)
+
+                dirname = self._wds.get(wd)
+                if dirname is None or not name:
+                    continue
+
+                path = os.path.join(dirname, os.fsdecode(name))
+                if path in self._paths:
+                    changed.append(path)
+
+        return changed
+
+    def run(self):
+        try:
+            FileWatcher.run(self)
+        finally:
+            # closed by the thread, so close() does not wait for it.
+            os.close(self._fd)
+
+def new_watcher(callback, delay = DEBOUNCE_DELAY):
+    """
+    a started watcher, inotify if possible, otherwise polling.
+    """
+
+    try:
+        watcher = InotifyWatcher(callback, delay)
+    except OSError:
+        watcher = PollingWatcher(callback, delay)
+
+    watcher.start()
+    return watcher
@@ -77,7 +77,7 @@ function! s:vim_enter_callback()
 endfunc
 
 function! s:buf_add_callback()
-    py3 add_files([vim.eval('expand("<afile>")')])
+    py3 add_buffer(vim.eval('expand("<afile>")'))
 endfunc
 
 function! s:file_type_callback()
@@ -92,6 +92,10 @@ function! s:buf_delete_callback()
     py3 remove_files([vim.eval('expand("<afile>")')])
 endfunc
 
+function! s:vim_leave_callback()
+    py3 save_cache()
+endfunc
+
 function! s:set_include_list(...)
     let inclist = []
     for pat in a:000
@@ -113,9 +117,23 @@ aug C_COMPLETE
     au FileType c,cpp call s:file_type_callback()
     au BufWritePost *.[ch] call s:buf_write_callback()
     au BufDelete *.[ch] call s:buf_delete_callback()
+    au VimLeavePre * call s:vim_leave_callback()
 aug END
 
 if !exists(":SetIncludeList")
     command -nargs=* -complete=dir SetIncludeList :call <SID>set_include_list(<f-args>)
 endif
 
+if !exists(":CtagsCacheStats")
+    command CtagsCacheStats :py3 print_stats()
+endif
+
+" e.g. set statusline+=%{CtagsCacheProgress()}
+function! CtagsCacheProgress()
+    return py3eval('progress_text()')
+endfunc
+
+if !exists(":CtagsCacheProgress")
+    command CtagsCacheProgress :echo CtagsCacheProgress()
+endif
+
@@ -1,45 +1,51 @@
 #!/usr/bin/env python
 
 import os
-import pdb
-import time
+import sys
+import shutil
+import tempfile
+
+TOP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TOP_DIR, 'bench'))
+
 from ctags_cache import CtagsCache
+from corpus import config_for_tags, generate_tree
+
+def wait(cache):
+    cache.find_tags('', 1, 1)
 
 print("test 1:")
-cache = CtagsCache()
-cache._update_file("test/test.c")
+cache = CtagsCache('c')
+cache.add_files([os.path.join(TOP_DIR, 'test/test.c')])
+wait(cache)
 cache.printall()
-cache._remove_file('test/test.c')
+cache.remove_files([os.path.join(TOP_DIR, 'test/test.c')])
+wait(cache)
 cache.printall()
 
 print("test 2:")
-cache = CtagsCache(['/home/lfw/works/linux-2.6/include', 'linux-2.6'])
-cache._update_file('/home/lfw/works/linux-2.6/fs/romfs/super.c')
-cache._update_file('/home/lfw/works/linux-2.6/fs/romfs/storage.c')
-cache._update_file('/home/lfw/works/linux-2.6/fs/romfs/storage.c')
-cache._update_file('/home/lfw/works/linux-2.6/fs/romfs/super.c')
-cache.printall()
-cache._remove_file('/home/lfw/works/linux-2.6/fs/romfs/super.c')
-cache._remove_file('/home/lfw/works/linux-2.6/fs/romfs/super.c')
-cache._remove_file('/home/lfw/works/linux-2.6/fs/romfs/storage.c')
-cache._remove_file('/home/lfw/works/linux-2.6/fs/romfs/storage.c')
-cache.printall()
-
-print("test 3:")
-import timeit
-
-cb_header = r"""
-import ctags_cache
-cache = ctags_cache.CtagsCache(['/home/lfw/works/linux-2.6/include', 'linux-2.6'])
-"""
-
-cb_body = "print(cache.find_tags('romfs_mtd'))"
-cb_body = r"""
-cache._update_file('/home/lfw/works/linux-2.6/fs/romfs/storage.c')
-cache._update_file('/home/lfw/works/linux-2.6/fs/romfs/super.c')
-cache._remove_file('/home/lfw/works/linux-2.6/fs/romfs/super.c')
-cache._remove_file('/home/lfw/works/linux-2.6/fs/romfs/storage.c')
-"""
-
-print(timeit.Timer(cb_body, cb_header).timeit(1))
-
+root = tempfile.mkdtemp(prefix = 'ctags_cache_test_')
+try:
+    files, incdir = generate_tree(root, config_for_tags(10000))
+    cache = CtagsCache('c', [incdir])
+    cache.add_files(files[:2])
+    cache.add_files(files[:1])
+    wait(cache)
+    cache.printall()
+    cache.remove_files(files[:1])
+    cache.remove_files(files[:2])
+    wait(cache)
+    cache.printall()
+
+    print("test 3:")
+    import timeit
+
+    def add_and_remove():
+        cache.add_files(files)
+        wait(cache)
+        cache.remove_files(files)
+        wait(cache)
+
+    print(timeit.Timer(add_and_remove).timeit(1))
+finally:
+    shutil.rmtree(root)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import pickle
+import shutil
+import tempfile
+import unittest
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+
+from ctags_cache import CtagsCache, PRIORITY_INTERACTIVE
+
+class CloseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.files = []
+        for i in range(20):
+            path = os.path.join(self.root, 'f%d.c' % i)
+            with open(path, 'w') as fobj:
+                fobj.write('int f%d;\n' % i)
+
+            self.files.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_close(self):
+        cache = CtagsCache('c', watch = 1)
+        cache.add_files(self.files[:1])
+        cache.find_tags('', 1, 1)
+        generation = cache.generation()
+
+        cache.add_files(self.files[1:])
+        cache.close()
+
+        cache._worker.join(10)
+        self.assertFalse(cache._worker.is_alive())
+        cache._watcher.join(10)
+        self.assertFalse(cache._watcher.is_alive())
+
+        # pending works are cancelled, later ones are ignored.
+        self.assertEqual(cache.progress(), None)
+        self.assertEqual(cache.find_tags('', 1, 1), None)
+        cache.add_files(self.files[:1])
+        self.assertEqual(cache._worker.pending(), 0)
+
+        # the snapshot is still there.
+        self.assertGreaterEqual(cache.generation(), generation)
+
+@unittest.skipUnless(shutil.which('ctags'), "needs ctags")
+class RemovedHeaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.inc1 = os.path.join(self.root, 'inc1')
+        self.inc2 = os.path.join(self.root, 'inc2')
+        os.makedirs(self.inc1)
+        os.makedirs(self.inc2)
+        self.header = os.path.join(self.inc1, 'gone.h')
+        with open(self.header, 'w') as fobj:
+            fobj.write('#define GONE 1\n')
+
+        self.src = os.path.join(self.root, 'a.c')
+        with open(self.src, 'w') as fobj:
+            fobj.write('#include <gone.h>\n#define A 1\n')
+
+        self.cache = CtagsCache('c', [self.inc1, self.inc2])
+        self.cache.add_files([self.src])
+        self.assertTrue(self.cache.find_tags('GONE', 1, 1))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.root)
+
+    def test_removed(self):
+        os.remove(self.header)
+        self.cache.update_files([self.header])
+        self.assertEqual(self.cache.find_tags('GONE', 1, 1), [])
+        self.assertTrue(self.cache.find_tags('A', 1))
+        self.assertEqual(self.cache.closure(self.src), {self.src})
+        self.assertTrue(self.cache.stats()['counters']['files_updated'])
+
+    def test_found_in_next_dir(self):
+        header = os.path.join(self.inc2, 'gone.h')
+        with open(header, 'w') as fobj:
+            fobj.write('#define NEXT 1\n')
+
+        os.remove(self.header)
+        self.cache.update_files([self.header])
+        self.assertEqual(self.cache.find_tags('GONE', 1, 1), [])
+        self.assertTrue(self.cache.find_tags('NEXT', 1))
+        self.assertEqual(self.cache.closure(self.src), {self.src, header})
+
+    def test_removed_root(self):
+        os.remove(self.src)
+        self.cache.update_files([self.src])
+        self.assertEqual(self.cache.find_tags('A', 1, 1), [])
+
+        # parsed again when it comes back.
+        with open(self.src, 'w') as fobj:
+            fobj.write('#include <gone.h>\n#define A 1\n')
+
+        self.cache.update_files([self.src])
+        self.assertTrue(self.cache.find_tags('A', 1, 1))
+
+@unittest.skipUnless(shutil.which('ctags'), "needs ctags")
+class SaveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.src = os.path.join(self.root, 'a.c')
+        with open(self.src, 'w') as fobj:
+            for i in range(300):
+                header = 'h%d.h' % i
+                with open(os.path.join(self.root, header), 'w') as hobj:
+                    hobj.write('#define H%d %d\n' % (i, i))
+
+                fobj.write('#include "%s"\n' % header)
+
+        self.cache_file = os.path.join(self.root, 'cache', 'tags')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def names(self, cache_file = None):
+        cache = CtagsCache('c')
+        try:
+            if cache_file:
+                cache.load(cache_file)
+
+            cache.add_files([self.src])
+            return sorted(tag['name'] for tag in cache.find_tags('', 0, 1))
+        finally:
+            cache.close()
+
+    def test_save_during_ingestion(self):
+        cache = CtagsCache('c')
+        try:
+            cache.add_files([self.src])
+            deadline = time.time() + 10
+            while not cache.progress() and time.time() < deadline:
+                time.sleep(0.001)
+
+            # the background ingestion is not drained by save, files not
+            # ingested yet are saved without tags.
+            cache.save(self.cache_file)
+            with open(self.cache_file, 'rb') as fobj:
+                files = pickle.load(fobj)['files']
+
+            self.assertEqual(len(files), 301)
+            self.assertIn(None, [file_tags for fingerprint, depends,
+                                 include_digest, file_tags in files.values()])
+        finally:
+            cache.close()
+
+        names = self.names()
+        self.assertEqual(len(names), 300)
+        self.assertEqual(self.names(self.cache_file), names)
+
+@unittest.skipUnless(shutil.which('ctags'), "needs ctags")
+class InteractiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.backlog = os.path.join(self.root, 'b.c')
+        with open(self.backlog, 'w') as fobj:
+            for i in range(300):
+                header = 'h%d.h' % i
+                with open(os.path.join(self.root, header), 'w') as hobj:
+                    hobj.write('#define H%d %d\n' % (i, i))
+
+                fobj.write('#include "%s"\n' % header)
+
+        # h299.h is queued last by b.c.
+        self.src = os.path.join(self.root, 'a.c')
+        with open(self.src, 'w') as fobj:
+            fobj.write('#include "h299.h"\n#define A 1\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_buffer_before_backlog(self):
+        cache = CtagsCache('c')
+        try:
+            cache.add_files([self.backlog])
+            deadline = time.time() + 10
+            while not cache.progress() and time.time() < deadline:
+                time.sleep(0.001)
+
+            cache.add_files([self.src], PRIORITY_INTERACTIVE)
+            cache._worker.call(lambda: None, PRIORITY_INTERACTIVE)
+
+            self.assertTrue(cache.find_tags('A', 1))
+            self.assertTrue(cache.find_tags('H299', 1))
+            self.assertIsNotNone(cache.progress())
+        finally:
+            cache.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+sys.path.insert(0, os.path.join(TOP_DIR, 'bench'))
+
+import fake_vim
+VIM = fake_vim.install()
+
+import c_complete
+from ctags_cache import CtagsCache
+
+HEADER = """#define TANGO 1
+#define TASK_S 2
+#define OTHER 3
+"""
+
+def complete(line):
+    VIM.set_buffer(['int f(void)', '{', line, '}'], 3, len(line))
+    start, completion = c_complete.find_completion_start()
+    return sorted(m['name'] for m in
+                  c_complete.find_completion_matches(completion,
+                                                     line[start:]))
+
+@unittest.skipUnless(shutil.which('ctags'), "needs ctags")
+class SessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        header = os.path.join(self.root, 'a.h')
+        with open(header, 'w') as fobj:
+            fobj.write(HEADER)
+
+        self.cache = c_complete.CTAGS_CACHE
+        c_complete.CTAGS_CACHE = CtagsCache('c')
+        c_complete.CTAGS_CACHE.add_files([header])
+        c_complete.CTAGS_CACHE.find_tags('', 1, 1)
+        c_complete.COMPLETION_START = None
+        c_complete.COMPLETION_SESSION = None
+
+    def tearDown(self):
+        c_complete.CTAGS_CACHE.close()
+        c_complete.CTAGS_CACHE = self.cache
+        shutil.rmtree(self.root)
+
+    def test_empty_word_not_narrowed(self):
+        self.assertEqual(complete('    '), [])
+        self.assertEqual(complete('    TA'), ['TANGO', 'TASK_S'])
+        self.assertEqual(complete('    TAN'), ['TANGO'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import stat
+import shutil
+import tempfile
+import unittest
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+
+from ctags_cache import CtagsCache
+from ctags_cache import ctags_process
+
+# answers every request of interactive mode with no tags.
+FAKE_CTAGS = """#!%s
+import sys
+if '--list-features' in sys.argv:
+    print('interactive')
+    sys.exit()
+
+print('{"_type": "program", "name": "fake"}', flush = True)
+for line in sys.stdin:
+    print('{"_type": "completed", "command": "generate-tags"}', flush = True)
+""" % sys.executable
+
+class CtagsPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        bindir = os.path.join(self.root, 'bin')
+        os.makedirs(bindir)
+        ctags = os.path.join(bindir, 'ctags')
+        with open(ctags, 'w') as fobj:
+            fobj.write(FAKE_CTAGS)
+
+        os.chmod(ctags, os.stat(ctags).st_mode | stat.S_IEXEC)
+
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = bindir + os.pathsep + self.path
+        self.supported = ctags_process._interactive_supported
+        ctags_process._interactive_supported = None
+
+        self.src = os.path.join(self.root, 'a.c')
+        with open(self.src, 'w') as fobj:
+            fobj.write('int a;\n')
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        ctags_process._interactive_supported = self.supported
+        shutil.rmtree(self.root)
+
+    def test_exit_after_close(self):
+        cache = CtagsCache('c', jobs = 2)
+        cache.add_files([self.src])
+        cache.find_tags('', 1, 1)
+
+        procs = [p._proc for p in cache._ctags_table._pool._procs
+                 if p._proc]
+        self.assertTrue(procs)
+        for proc in procs:
+            self.assertIsNone(proc.poll())
+
+        cache.close()
+        cache._worker.join(10)
+        for proc in procs:
+            self.assertIsNotNone(proc.poll())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+
+from ctags_cache import CtagsCache
+from ctags_cache.include_graph import IncludeGraph
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, 'w') as fobj:
+        fobj.write(text)
+
+class DanglingHeaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.inc1 = os.path.join(self.root, 'inc1')
+        self.inc2 = os.path.join(self.root, 'inc2')
+        self.src = os.path.join(self.root, 'src', 'a.c')
+        os.makedirs(self.inc1)
+        os.symlink(os.path.join(self.root, 'missing.h'),
+                   os.path.join(self.inc1, 'foo.h'))
+        write(self.src, '#include <foo.h>\nint a;\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def closure(self, inclist):
+        cache = CtagsCache('c', inclist)
+        try:
+            cache.add_files([self.src])
+            return cache.closure(self.src)
+        finally:
+            cache.close()
+
+    def test_skipped(self):
+        self.assertEqual(self.closure([self.inc1]), {self.src})
+
+    def test_resolved_in_next_dir(self):
+        header = os.path.join(self.inc2, 'foo.h')
+        write(header, 'int foo;\n')
+        self.assertEqual(self.closure([self.inc1, self.inc2]),
+                         {self.src, header})
+
+class UnreadableDependTest(unittest.TestCase):
+
+    def test_dropped_from_includer(self):
+        # b.h is removed after a.c is scanned.
+        depends = {'a.c': frozenset(['b.h', 'c.h']), 'c.h': frozenset()}
+        graph = IncludeGraph()
+        self.assertEqual(graph.add_root('a.c', depends.get), ['a.c', 'c.h'])
+        self.assertEqual(graph.depends('a.c'), {'c.h'})
+        self.assertEqual(graph.dependents('b.h'), set())
+        self.assertEqual(graph.closure(['a.c']), {'a.c', 'c.h'})
+        self.assertEqual(sorted(graph.remove_root('a.c')), ['a.c', 'c.h'])
+        self.assertEqual(len(graph), 0)
+
+    def test_unreadable_root(self):
+        graph = IncludeGraph()
+        self.assertEqual(graph.add_root('a.c', lambda path: None), [])
+        self.assertEqual(graph.remove_root('a.c'), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import random
+import unittest
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+
+from ctags_cache.include_graph import IncludeGraph
+
+class CountingDict(dict):
+    """
+    counts the files whose depends are looked up.
+    """
+
+    def __init__(self, *args):
+        dict.__init__(self, *args)
+        self.visits = 0
+
+    def __getitem__(self, key):
+        self.visits += 1
+        return dict.__getitem__(self, key)
+
+def reachable(roots, depends):
+    res = set()
+    stack = list(roots)
+    while stack:
+        p = stack.pop()
+        if p not in res:
+            res.add(p)
+            stack.extend(depends[p])
+
+    return res
+
+class DetachTest(unittest.TestCase):
+
+    def test_shared_headers_not_expanded(self):
+        # both roots include common.h, which includes 1000 headers.
+        depends = {'a.c': frozenset(['common.h', 'a.h']),
+                   'b.c': frozenset(['common.h']),
+                   'a.h': frozenset(),
+                   'common.h': frozenset('h%d.h' % i for i in range(1000))}
+        for i in range(1000):
+            depends['h%d.h' % i] = frozenset()
+
+        graph = IncludeGraph()
+        graph.add_root('a.c', depends.get)
+        graph.add_root('b.c', depends.get)
+
+        graph._depends = CountingDict(graph._depends)
+        self.assertEqual(sorted(graph.remove_root('a.c')), ['a.c', 'a.h'])
+        self.assertLess(graph._depends.visits, 10)
+        self.assertEqual(len(graph), 1002)
+
+    def test_unreachable_cycle(self):
+        depends = {'a.c': frozenset(['x.h']), 'x.h': frozenset(['y.h']),
+                   'y.h': frozenset(['x.h', 'z.h']), 'z.h': frozenset()}
+        graph = IncludeGraph()
+        graph.add_root('a.c', depends.get)
+        self.assertEqual(sorted(graph.remove_root('a.c')),
+                         ['a.c', 'x.h', 'y.h', 'z.h'])
+        self.assertEqual(len(graph), 0)
+
+    def test_random_graphs(self):
+        rand = random.Random(0)
+        for i in range(200):
+            files = ['f%d' % j for j in range(12)]
+            depends = {f: frozenset(rand.sample(files, rand.randrange(3)))
+                       for f in files}
+            roots = rand.sample(files, 4)
+
+            graph = IncludeGraph()
+            for root in roots:
+                graph.add_root(root, depends.get)
+
+            live = reachable(roots, depends)
+            for root in rand.sample(roots, 4):
+                roots.remove(root)
+                now_live = reachable(roots, depends)
+                self.assertEqual(set(graph.remove_root(root)),
+                                 live - now_live)
+                self.assertEqual(set(graph._depends), now_live)
+                for path in now_live:
+                    self.assertEqual(graph.dependents(path),
+                                     {p for p in now_live
+                                        if path in depends[p]})
+
+                live = now_live
+
+if __name__ == "__main__":
+    unittest.main()
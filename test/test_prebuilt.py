@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+
+from ctags_cache import CtagsCache
+from ctags_cache.prebuilt import build_index, index_file
+
+HEADER = """#define FOO_SIZE 4
+struct foo {
+    int a;
+    char b;
+};
+"""
+
+def names(tags):
+    return sorted(tag['name'] for tag in tags)
+
+@unittest.skipUnless(shutil.which('ctags'), "needs ctags")
+class PrebuiltTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.incdir = os.path.join(self.root, 'include')
+        self.prebuilt_dir = os.path.join(self.root, 'prebuilt')
+        self.src = os.path.join(self.root, 'a.c')
+        os.makedirs(self.incdir)
+        with open(os.path.join(self.incdir, 'foo.h'), 'w') as fobj:
+            fobj.write(HEADER)
+
+        with open(self.src, 'w') as fobj:
+            fobj.write('#include <foo.h>\n')
+
+        build_index(self.incdir, index_file(self.prebuilt_dir, self.incdir))
+
+        self.cache = CtagsCache('c', [self.incdir],
+                                prebuilt_dir = self.prebuilt_dir)
+        self.cache.add_files([self.src])
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.root)
+
+    def test_fresh_lookup(self):
+        fresh = self.cache.find_tags('foo', 1, 1)
+        self.assertEqual(names(fresh), ['foo'])
+        self.assertEqual(names(fresh), names(self.cache.find_tags('foo', 1)))
+        self.assertEqual(self.cache.stats()['counters']['files_prebuilt'], 1)
+
+        members = self.cache.find_members('foo', 1)
+        self.assertEqual(names(members), ['foo::a', 'foo::b'])
+        self.assertEqual(names(members),
+                         names(self.cache.find_members('foo')))
+
+    def test_tags(self):
+        self.cache.find_tags('', 1, 1)
+        self.assertEqual(self.cache._ctags_table.tags(),
+                         self.cache.stats()['tags'])
+        self.assertEqual(len(self.cache.find_tags('', 0, 1)),
+                         self.cache.stats()['tags'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import random
+import unittest
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+sys.path.insert(0, os.path.join(TOP_DIR, 'bench'))
+
+import fake_vim
+fake_vim.install()
+
+from c_complete import BufferScopeIndex
+
+SOURCE = """struct foo {
+    int a;
+};
+
+int f(int x, char *y)
+{
+    int i;
+    struct foo s;
+
+    if (x) {
+        int j;
+        for (;;) {
+            char c;
+        }
+    }
+
+    return 0;
+}
+
+static void g(void)
+{
+    long k;
+}
+"""
+
+# lines inserted by random edits.
+SNIPPETS = ['{', '}', '    int n;', '    if (y) {', '    }', '', 'int h(void)',
+            '        char *p;', 'struct bar { int b; };']
+
+def state(index):
+    return (index._positions, index._chars, index._enclosing, index._opens)
+
+class IncrementalTest(unittest.TestCase):
+
+    def check(self, prev, lines):
+        index = BufferScopeIndex(lines, prev.changedtick + 1, 8, 4, prev)
+        full = BufferScopeIndex(lines, prev.changedtick + 1, 8, 4)
+        self.assertEqual(state(index), state(full))
+        for row, line in enumerate(lines):
+            for col in (0, len(line)):
+                self.assertEqual(index.local_vars(row, col),
+                                 full.local_vars(row, col))
+
+        return index
+
+    def test_random_edits(self):
+        rand = random.Random(0)
+        lines = SOURCE.splitlines()
+        index = BufferScopeIndex(lines, 1, 8, 4)
+        for i in range(300):
+            lines = list(lines)
+            row = rand.randrange(len(lines) + 1)
+            op = rand.randrange(3)
+            if op == 0 or len(lines) < 5:
+                lines.insert(row, rand.choice(SNIPPETS))
+            elif op == 1:
+                del lines[min(row, len(lines) - 1)]
+            else:
+                lines[min(row, len(lines) - 1)] += rand.choice(SNIPPETS)
+
+            index = self.check(index, lines)
+
+    def test_unchanged(self):
+        lines = SOURCE.splitlines()
+        index = BufferScopeIndex(lines, 1, 8, 4)
+        self.check(index, list(lines))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+
+from ctags_cache.server import CtagsCacheServer, CtagsCacheClient
+from ctags_cache.server import ServerError
+
+class ServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.socket_path = os.path.join(self.root, 'server.sock')
+        self.server = CtagsCacheServer(self.socket_path, jobs = 1,
+                                       prebuilt_dir = '')
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.root)
+
+    def wait_closed(self, cache):
+        # the handler releases the cache after the client disconnects.
+        cache._worker.join(10)
+        self.assertFalse(cache._worker.is_alive())
+
+    def test_closed_by_last_client(self):
+        first = CtagsCacheClient(self.socket_path, 'c', [self.root])
+        second = CtagsCacheClient(self.socket_path, 'c', [self.root])
+        other = CtagsCacheClient(self.socket_path, 'c')
+        self.assertEqual(len(self.server._caches), 2)
+
+        shared, count = self.server._caches[('c', (self.root,))]
+        self.assertEqual(count, 2)
+
+        first.close()
+        second.generation()
+        self.assertTrue(shared._worker.is_alive())
+
+        second.close()
+        self.wait_closed(shared)
+        other.generation()
+        self.assertEqual(list(self.server._caches), [('c', ())])
+
+        cache = self.server._caches[('c', ())][0]
+        other.close()
+        self.wait_closed(cache)
+        self.assertEqual(self.server._caches, {})
+
+    def test_reopen_releases(self):
+        client = CtagsCacheClient(self.socket_path, 'c', [self.root])
+        cache = self.server._caches[('c', (self.root,))][0]
+        client._request({'op': 'open', 'filetype': 'c', 'inclist': []})
+        self.wait_closed(cache)
+        self.assertEqual(list(self.server._caches), [('c', ())])
+        client.close()
+
+    def test_server_error_is_os_error(self):
+        client = CtagsCacheClient(self.socket_path, 'c')
+        try:
+            with self.assertRaises(OSError):
+                client._request({'op': 'unknown'})
+
+            with self.assertRaises(ServerError):
+                client._request({'op': 'unknown'})
+        finally:
+            client.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import threading
+import unittest
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+
+from ctags_cache.tag import LazyTag
+from ctags_cache.ctags_table import parse_ctags_output
+
+DATA = b''.join(b'v%d\t/src/a.c\t%d;"\tkind:v\ttyperef:typename:int\n' %
+                (i, i) for i in range(2000))
+
+class LazyTagTest(unittest.TestCase):
+
+    def setUp(self):
+        self.interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.interval)
+
+    def test_concurrent_load(self):
+        # like the tags of a mapped prebuilt index.
+        tags = []
+        off = 0
+        while off < len(DATA):
+            name = DATA[off:DATA.index(b'\t', off)].decode('utf-8')
+            tags.append(LazyTag(name, '/src/a.c', DATA, off))
+            off = DATA.index(b'\n', off) + 1
+
+        results = [None] * 8
+        start = threading.Barrier(len(results))
+
+        def load(i):
+            start.wait()
+            results[i] = [dict(tag.load().items()) for tag in tags]
+
+        threads = [threading.Thread(target = load, args = (i,))
+                   for i in range(len(results))]
+        for t in threads:
+            t.start()
+
+        for t in threads:
+            t.join()
+
+        expected = [dict(tag.items()) for tag in parse_ctags_output(DATA)]
+        for res in results:
+            self.assertEqual(res, expected)
+
+if __name__ == "__main__":
+    unittest.main()